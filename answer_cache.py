@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_PATH = 'answer_cache.sqlite'
+
+
+class SemanticAnswerCache:
+    def __init__(self, path: str = DEFAULT_PATH, threshold: float = 0.93, max_entries: int = 5000,
+                 ttl: float = 7 * 24 * 3600, touch_interval: float = 3600.0):
+        """
+        Кэш ответов для близких по смыслу вопросов. Ключ - эмбеддинг вопроса, коллекция и модель;
+        если косинусная близость к сохраненному вопросу не ниже порога, модель не вызывается.
+        Хранится в SQLite, поэтому переживает перезапуск и видит сбросы из других процессов
+        :param path: путь к файлу базы
+        :param threshold: порог косинусной близости вопросов
+        :param max_entries: максимальное количество ответов (лишние вытесняются по LRU)
+        :param ttl: время жизни ответа в секундах
+        :param touch_interval: время последнего обращения обновляется не чаще раза в touch_interval секунд:
+            запись на каждое попадание держала бы блокировку записи и заставляла другие процессы перечитывать кэш
+        """
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS answers ('
+            'id INTEGER PRIMARY KEY, collection TEXT NOT NULL, version TEXT NOT NULL, model TEXT NOT NULL, '
+            'question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, latency REAL NOT NULL, '
+            'created REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        # Время последнего сброса по коллекции ('*' - по всем): по нему отбрасываются ответы,
+        # построенные на результатах поиска, полученных до перезагрузки коллекции
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS invalidations (collection TEXT PRIMARY KEY, time REAL NOT NULL)'
+        )
+        self._conn.commit()
+        self._data_version = None
+        self._groups: dict[tuple[str, str, str], tuple[list[int], np.ndarray]] = {}
+
+    def _reload_if_changed(self) -> None:
+        # data_version меняется, когда базу изменило другое соединение (например, скрипт загрузки)
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version and self._groups is not None:
+            return
+        self._data_version = data_version
+        rows = self._conn.execute(
+            'SELECT id, collection, version, model, embedding FROM answers WHERE created > ?',
+            (time.time() - self.ttl,)
+        ).fetchall()
+        groups: dict[tuple[str, str, str], tuple[list[int], list[np.ndarray]]] = {}
+        for row_id, collection, version, model, blob in rows:
+            ids, vectors = groups.setdefault((collection, version, model), ([], []))
+            ids.append(row_id)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self._groups = {key: (ids, np.stack(vectors)) for key, (ids, vectors) in groups.items()}
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, embedding, collection: str, model: str, version: str = '') -> Optional[str]:
+        """
+        Ищет ответ на близкий вопрос
+        :param embedding: эмбеддинг вопроса
+        :param collection: название коллекции
+        :param model: название модели, давшей ответ
+        :param version: версия коллекции (например, ее id), ответы для других версий не используются
+        :return: сохраненный ответ или None
+        """
+        query = self._unit(embedding)
+        with self._lock:
+            self._reload_if_changed()
+            ids, matrix = self._groups.get((collection, version, model), ([], None))
+            if matrix is not None:
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self._conn.execute(
+                        'SELECT answer, latency, created, last_access FROM answers WHERE id = ?', (ids[best],)
+                    ).fetchone()
+                    now = time.time()
+                    if row is not None and now - row[2] <= self.ttl:
+                        if now - row[3] > self.touch_interval:
+                            self._conn.execute('UPDATE answers SET last_access = ? WHERE id = ?', (now, ids[best]))
+                            self._conn.commit()
+                        self.hits += 1
+                        self.latency_saved += row[1]
+                        return row[0]
+            self.misses += 1
+            return None
+
+    def invalidated_at(self, collection: str) -> float:
+        """
+        Время последнего сброса ответов по коллекции (в том числе из другого процесса)
+        :param collection: название коллекции
+        :return: время в секундах (time.time()) или 0, если коллекцию не сбрасывали
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(time) FROM invalidations WHERE collection IN (?, '*')", (collection,)
+            ).fetchone()
+        return row[0] or 0.0
+
+    def store(self, question: str, embedding, collection: str, model: str, answer: str, latency: float,
+              version: str = '', retrieved_at: Optional[float] = None) -> bool:
+        """
+        Сохраняет ответ
+        :param question: исходный вопрос (для отладки)
+        :param embedding: эмбеддинг вопроса
+        :param collection: название коллекции
+        :param model: название модели
+        :param answer: ответ модели
+        :param latency: сколько занял ответ (сек) - учитывается как сэкономленное время при попаданиях
+        :param version: версия коллекции
+        :param retrieved_at: когда получены фрагменты, на которых построен ответ; ответ по результатам
+            поиска, полученным до последнего сброса коллекции, не сохраняется
+        :return: True, если ответ сохранен
+        """
+        now = time.time()
+        if retrieved_at is not None and retrieved_at < self.invalidated_at(collection):
+            return False
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO answers (collection, version, model, question, embedding, answer, latency, created, '
+                'last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (collection, version, model, question, self._unit(embedding).tobytes(), answer, latency, now, now)
+            )
+            self._conn.execute('DELETE FROM answers WHERE created <= ?', (now - self.ttl,))
+            self._conn.execute(
+                'DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self._conn.commit()
+            self._groups = None
+        return True
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        """
+        Удаляет ответы по коллекции (или все ответы)
+        :param collection: название перезагруженной коллекции
+        """
+        with self._lock:
+            if collection is None:
+                self._conn.execute('DELETE FROM answers')
+            else:
+                self._conn.execute('DELETE FROM answers WHERE collection = ?', (collection,))
+            self._conn.execute('INSERT OR REPLACE INTO invalidations (collection, time) VALUES (?, ?)',
+                               ('*' if collection is None else collection, time.time()))
+            self._conn.commit()
+            self._groups = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'latency_saved': self.latency_saved
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def invalidate_persisted_answers(collection: str, path: str = DEFAULT_PATH) -> None:
+    """
+    Сбрасывает сохраненные ответы по коллекции после ее перезагрузки.
+    Запущенные процессы GUI увидят изменение при следующем поиске
+    :param collection: название коллекции
+    :param path: путь к файлу кэша ответов
+    """
+    if not os.path.exists(path):
+        return
+    cache = SemanticAnswerCache(path)
+    cache.invalidate(collection)
+    cache.close()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).parent
+SEED = 42
+QUESTIONS = [
+    'Сколько дней длится ежегодный оплачиваемый отпуск?',
+    'Как расторгнуть трудовой договор по инициативе работника?',
+    'Какая продолжительность рабочего времени в неделю?',
+    'Когда работодатель обязан выплатить заработную плату?',
+    'Что такое испытательный срок при приеме на работу?',
+    'Какие гарантии предоставляются беременным женщинам?',
+    'Как оплачивается сверхурочная работа?',
+    'В каких случаях допускается работа в выходные дни?',
+]
+# Для пропускной способности больше - лучше, для задержек и времени - меньше
+HIGHER_IS_BETTER = ('_per_sec',)
+
+
+def _seed_everything() -> None:
+    random.seed(SEED)
+    np.random.seed(SEED)
+    try:
+        import torch
+        torch.manual_seed(SEED)
+    except ImportError:
+        pass
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    values = np.array(latencies) * 1000
+    return {f'p{p}_ms': float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def bench_embedding(embedder, texts: list[str]) -> dict:
+    """Пропускная способность TextEmbedder: поштучно и пакетно"""
+    embedder.texts_to_embeddings(texts[:8])  # прогрев
+    start = time.perf_counter()
+    for text in texts[:50]:
+        embedder.text_to_embedding(text)
+    single = 50 / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embedder.texts_to_embeddings(texts)
+    batched = len(texts) / (time.perf_counter() - start)
+    return {'embedding_single_texts_per_sec': single, 'embedding_batch_texts_per_sec': batched}
+
+
+def bench_ingestion(embedder, data: dict) -> tuple[dict, object]:
+    """Пропускная способность fill_db_from_json с коллекцией в памяти вместо сервера Chroma"""
+    from fill_db_story import fill_db_from_json
+    from memory_collection import InMemoryClient
+
+    collection = InMemoryClient().create_collection('benchmark_tk_rf')
+    start = time.perf_counter()
+    fill_db_from_json(data, embedding_model=embedder, collection=collection)
+    elapsed = time.perf_counter() - start
+    return {'ingestion_records_per_sec': collection.count() / elapsed, 'ingestion_time_sec': elapsed}, collection
+
+
+def bench_retrieval(embedder, collection, repeats: int = 50) -> dict:
+    """Задержка get_sentences_by_embedding (эмбеддинги вопросов готовы заранее)"""
+    from fill_db_story import get_sentences_by_embedding
+
+    embeddings = embedder.texts_to_embeddings(QUESTIONS)
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        get_sentences_by_embedding(embeddings[i % len(QUESTIONS)], collection, n_results=3)
+        latencies.append(time.perf_counter() - start)
+    return {f'retrieval_{key}': value for key, value in _percentiles(latencies).items()}
+
+
+def bench_generation(lm, collection, embedder, new_tokens: int = 32) -> dict:
+    """Скорость prefill и decode в LanguageModel.ask: ровно new_tokens новых токенов, жадная генерация"""
+    from fill_db_story import get_passages_by_embedding
+    from tracing import tracer
+
+    def totals() -> dict:
+        return {stage: (value['count'], value['avg'] * value['count'])
+                for stage, value in tracer.summary().items()}
+
+    prompt_tokens, latencies = 0, []
+    before = totals()
+    for question, embedding in zip(QUESTIONS, embedder.texts_to_embeddings(QUESTIONS)):
+        packed = lm.pack_context(question, get_passages_by_embedding(embedding, collection))
+        prompt_tokens += packed.prompt_tokens
+        start = time.perf_counter()
+        lm.ask(question, packed.text, max_length=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+               temperature=None, top_p=None)
+        latencies.append(time.perf_counter() - start)
+    after = totals()
+
+    prefill = after['prefill'][1] - before.get('prefill', (0, 0.0))[1]
+    decode = after['decode'][1] - before.get('decode', (0, 0.0))[1]
+    # Первый новый токен получается в prefill, остальные - в decode
+    return {
+        'generation_prefill_tokens_per_sec': prompt_tokens / prefill,
+        'generation_decode_tokens_per_sec': (new_tokens - 1) * len(QUESTIONS) / decode,
+        **{f'generation_{key}': value for key, value in _percentiles(latencies).items()}
+    }
+
+
+def run(suites: list[str], embedder_model: str, llm_model: str, limit: int) -> dict:
+    _seed_everything()
+    from embedding_worker import TextEmbedder
+
+    with open(ROOT / 'tk_rf.json', 'r', encoding='utf-8') as f:
+        data = dict(list(json.load(f).items())[:limit])
+    # Без кэша эмбеддингов: замеряется сама модель
+    embedder = TextEmbedder(embedder_model)
+    results = {}
+
+    if 'embedding' in suites:
+        results.update(bench_embedding(embedder, list(data.values())))
+    collection = None
+    if {'ingestion', 'retrieval', 'generation'} & set(suites):
+        ingestion, collection = bench_ingestion(embedder, data)
+        if 'ingestion' in suites:
+            results.update(ingestion)
+    if 'retrieval' in suites:
+        results.update(bench_retrieval(embedder, collection))
+    if 'generation' in suites:
+        from llm_widget import LanguageModel
+        lm = LanguageModel(llm_model, use_prefix_cache=False)
+        results.update(bench_generation(lm, collection, embedder))
+    return results
+
+
+def environment(args) -> dict:
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'embedder': args.embedder, 'llm': args.llm, 'limit': args.limit, 'seed': SEED}
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def find_regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for key, value in baseline.items():
+        if key not in current or not value:
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            if current[key] < value * (1 - tolerance):
+                regressions.append(f'{key}: {current[key]:.2f} против {value:.2f} в базовом замере')
+        elif current[key] > value * (1 + tolerance):
+            regressions.append(f'{key}: {current[key]:.2f} против {value:.2f} в базовом замере')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замеры эмбеддингов, загрузки, поиска и генерации на tk_rf.json')
+    parser.add_argument('--suites', default='embedding,ingestion,retrieval,generation',
+                        help='какие замеры запускать (через запятую)')
+    parser.add_argument('--embedder', default='paraphrase-multilingual-MiniLM-L12-v2')
+    parser.add_argument('--llm', default='TinyLlama/TinyLlama-1.1B-Chat-v1.0')
+    parser.add_argument('--limit', type=int, default=300, help='сколько статей брать из tk_rf.json')
+    parser.add_argument('--output', default='benchmark_results.json', help='файл с результатами')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='файл с базовым замером')
+    parser.add_argument('--save', action='store_true', help='сохранить текущий замер как базовый')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение (доля)')
+    args = parser.parse_args()
+
+    # Только локальные файлы моделей, без обращений к сети
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+    results = run(args.suites.split(','), args.embedder, args.llm, args.limit)
+    for key, value in results.items():
+        print(f'{key}: {value:.2f}')
+    report = {'environment': environment(args), 'results': results}
+    (ROOT / args.output).write_text(json.dumps(report, indent=4, ensure_ascii=False), encoding='utf-8')
+
+    baseline_path = ROOT / args.baseline
+    if args.save:
+        baseline_path.write_text(json.dumps(results, indent=4), encoding='utf-8')
+    elif baseline_path.exists():
+        regressions = find_regressions(results, json.loads(baseline_path.read_text(encoding='utf-8')),
+                                       args.tolerance)
+        for line in regressions:
+            print(f'Регрессия: {line}')
+        sys.exit(1 if regressions else 0)
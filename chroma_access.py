@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Optional
+
+import numpy as np
+
+
+# Ошибки, означающие, что коллекции с закэшированным id больше нет (ее удалили или пересоздали):
+# NotFoundError в chromadb 1.x, InvalidCollectionException и ValueError "... does not exist" в 0.x
+_STALE_HANDLE_ERRORS = ('NotFoundError', 'InvalidCollectionException')
+
+
+def _is_stale_handle(error: Exception) -> bool:
+    if type(error).__name__ in _STALE_HANDLE_ERRORS:
+        return True
+    message = str(error)
+    return isinstance(error, ValueError) and ('does not exist' in message or 'не существует' in message)
+
+
+def _query_key(name: str, query_embeddings, n_results: int, kwargs: dict) -> tuple:
+    vectors = np.asarray(query_embeddings, dtype=np.float32)
+    return name, hashlib.sha1(vectors.tobytes()).hexdigest(), vectors.shape, n_results, repr(sorted(kwargs.items()))
+
+
+class _SingleFlight:
+    def __init__(self):
+        """Объединяет одновременные одинаковые запросы: выполняется первый, остальные ждут его результат"""
+        self._lock = threading.Lock()
+        self._in_flight: dict[tuple, Future] = {}
+        self.merged = 0
+
+    def run(self, key: tuple, func):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.merged += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+
+class CachedCollection:
+    def __init__(self, access: "ChromaAccess", collection):
+        """
+        Закэшированный дескриптор коллекции. query() идет через объединение одинаковых запросов,
+        остальные методы передаются коллекции Chroma как есть
+        """
+        self._access = access
+        self._collection = collection
+
+    def __getattr__(self, item: str):
+        return getattr(self._collection, item)
+
+    def query(self, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        key = _query_key(self._collection.name, query_embeddings, n_results, kwargs)
+        return self._access.single_flight.run(
+            key, lambda: self._access.query(self._collection.name, query_embeddings, n_results, **kwargs)
+        )
+
+
+class ChromaAccess:
+    def __init__(self, client, ttl: float = 300.0):
+        """
+        Слой доступа к Chroma: один клиент (и его пул keep-alive соединений) на процесс,
+        кэш дескрипторов коллекций вместо get_collection на каждый вопрос и объединение
+        одновременных одинаковых запросов. Подходит везде, где ожидается клиент Chroma
+        :param client: клиент Chroma (HttpClient, PersistentClient или InMemoryClient)
+        :param ttl: время жизни дескриптора (сек); защищает от пересоздания коллекции другим процессом
+        """
+        self.client = client
+        self.ttl = ttl
+        self.single_flight = _SingleFlight()
+        self._lock = threading.Lock()
+        self._handles: dict[str, tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, item: str):
+        return getattr(self.client, item)
+
+    def _handle(self, name: str):
+        with self._lock:
+            cached = self._handles.get(name)
+            if cached is not None and time.time() - cached[0] <= self.ttl:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        collection = self.client.get_collection(name)
+        with self._lock:
+            self._handles[name] = (time.time(), collection)
+        return collection
+
+    def get_collection(self, name: str, **kwargs) -> CachedCollection:
+        return CachedCollection(self, self._handle(name))
+
+    def get_or_create_collection(self, name: str, **kwargs) -> CachedCollection:
+        collection = self.client.get_or_create_collection(name, **kwargs)
+        with self._lock:
+            self._handles[name] = (time.time(), collection)
+        return CachedCollection(self, collection)
+
+    def create_collection(self, name: str, **kwargs) -> CachedCollection:
+        collection = self.client.create_collection(name, **kwargs)
+        with self._lock:
+            self._handles[name] = (time.time(), collection)
+        return CachedCollection(self, collection)
+
+    def delete_collection(self, name: str) -> None:
+        self.invalidate(name)
+        self.client.delete_collection(name)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Сбрасывает дескриптор коллекции (или все дескрипторы), например после ее перезагрузки
+        :param name: название коллекции
+        """
+        with self._lock:
+            if name is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(name, None)
+
+    def query(self, name: str, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        """
+        Поиск по коллекции - один запрос к серверу при закэшированном дескрипторе.
+        Если дескриптор устарел (коллекцию пересоздали), он сбрасывается и запрос повторяется один раз;
+        остальные ошибки (сеть, неверные аргументы) пробрасываются сразу
+        """
+        try:
+            return self._handle(name).query(query_embeddings, n_results=n_results, **kwargs)
+        except Exception as e:
+            if not _is_stale_handle(e):
+                raise
+            self.invalidate(name)
+            return self._handle(name).query(query_embeddings, n_results=n_results, **kwargs)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'merged_queries': self.single_flight.merged}
+
+
+class AsyncChromaAccess:
+    def __init__(self, client, ttl: float = 300.0):
+        """
+        Асинхронный вариант ChromaAccess поверх chromadb.AsyncHttpClient
+        :param client: асинхронный клиент Chroma
+        :param ttl: время жизни дескриптора коллекции (сек)
+        """
+        self.client = client
+        self.ttl = ttl
+        self._handles: dict[str, tuple[float, Any]] = {}
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self.merged = 0
+
+    async def get_collection(self, name: str):
+        cached = self._handles.get(name)
+        if cached is not None and time.time() - cached[0] <= self.ttl:
+            return cached[1]
+        collection = await self.client.get_collection(name)
+        self._handles[name] = (time.time(), collection)
+        return collection
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        if name is None:
+            self._handles.clear()
+        else:
+            self._handles.pop(name, None)
+
+    async def _query(self, name: str, query_embeddings, n_results: int, **kwargs) -> dict:
+        try:
+            collection = await self.get_collection(name)
+            return await collection.query(query_embeddings, n_results=n_results, **kwargs)
+        except Exception as e:
+            if not _is_stale_handle(e):
+                raise
+            self.invalidate(name)
+            collection = await self.get_collection(name)
+            return await collection.query(query_embeddings, n_results=n_results, **kwargs)
+
+    async def query(self, name: str, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        """Поиск по коллекции; одновременные одинаковые запросы ждут один общий"""
+        key = _query_key(name, query_embeddings, n_results, kwargs)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.merged += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._query(name, query_embeddings, n_results, **kwargs))
+        self._in_flight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._in_flight.pop(key, None)
+
+
+_shared: dict[tuple[str, int], ChromaAccess] = {}
+_shared_lock = threading.Lock()
+
+
+def get_chroma(host: Optional[str] = None, port: Optional[int] = None) -> ChromaAccess:
+    """
+    Общий для процесса доступ к серверу Chroma (по умолчанию CHROMA_HOST/CHROMA_PORT или localhost:8000)
+    """
+    host = host or os.getenv('CHROMA_HOST', 'localhost')
+    port = port or int(os.getenv('CHROMA_PORT', '8000'))
+    with _shared_lock:
+        if (host, port) not in _shared:
+            import chromadb
+            _shared[(host, port)] = ChromaAccess(chromadb.HttpClient(host=host, port=port))
+        return _shared[(host, port)]
+
+
+async def get_async_chroma(host: Optional[str] = None, port: Optional[int] = None) -> AsyncChromaAccess:
+    """Асинхронный доступ к серверу Chroma для кода на asyncio"""
+    import chromadb
+    client = await chromadb.AsyncHttpClient(host=host or os.getenv('CHROMA_HOST', 'localhost'),
+                                            port=port or int(os.getenv('CHROMA_PORT', '8000')))
+    return AsyncChromaAccess(client)
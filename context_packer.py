@@ -0,0 +1,130 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+# Конец предложения: точка, вопросительный или восклицательный знак, точка с запятой
+# (ей заканчиваются пункты статей ТК РФ), затем пробел.
+# Точка после цифры - номер пункта ("1. Работник..."), а не конец предложения
+SENTENCE_END = re.compile(r'(?<=[^\d\s][.!?;])\s+')
+
+
+def split_sentences(text: str) -> list[str]:
+    """Разбивает текст на предложения, сохраняя знаки препинания. Переносы строк из PDF склеиваются"""
+    return [sentence for sentence in SENTENCE_END.split(' '.join(text.split())) if sentence]
+
+
+def approximate_token_count(text: str) -> int:
+    """Оценка числа токенов для моделей без локального токенизатора (GigaChat): ~3 символа на токен кириллицы"""
+    return len(text) // 3 + 1
+
+
+def _normalize(sentence: str) -> str:
+    return ' '.join(sentence.lower().split())
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    passages: int
+    duplicates: int
+    truncated: bool
+    prompt_tokens: Optional[int] = None
+
+
+class ContextPacker:
+    def __init__(self, count_tokens: Callable[[str], int], max_tokens: int, duplicate_threshold: float = 0.8):
+        """
+        Собирает контекст для промпта из найденных фрагментов в пределах бюджета токенов.
+        Фрагменты идут по возрастанию расстояния, повторяющиеся предложения пропускаются,
+        последний фрагмент обрезается по границе предложения
+        :param count_tokens: функция подсчета токенов (токенизатор модели)
+        :param max_tokens: бюджет токенов на контекст
+        :param duplicate_threshold: доля уже включенных предложений, при которой фрагмент считается дублем
+        """
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+
+    def pack(self, passages: Iterable[tuple[str, float]], max_tokens: Optional[int] = None) -> PackedContext:
+        """
+        :param passages: пары (текст, расстояние до вопроса)
+        :param max_tokens: бюджет для этого запроса (по умолчанию self.max_tokens)
+        :return: собранный контекст с нумерацией фрагментов, как в get_sentences_by_embedding
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        seen: set[str] = set()
+        parts: list[str] = []
+        used = duplicates = tokens = 0
+        truncated = False
+
+        for text, _ in sorted(passages, key=lambda passage: passage[1]):
+            sentences = split_sentences(text)
+            new = [sentence for sentence in sentences if _normalize(sentence) not in seen]
+            if not new or len(new) <= len(sentences) * (1 - self.duplicate_threshold):
+                duplicates += 1
+                continue
+
+            header = f'{len(parts) + 1}. '
+            kept = []
+            for sentence in new:
+                cost = self.count_tokens((header if not kept else ' ') + sentence)
+                if cost > budget:
+                    truncated = True
+                    break
+                kept.append(sentence)
+                budget -= cost
+                tokens += cost
+            if not kept and not parts:
+                # Даже первое предложение не влезает - режем его по словам
+                kept = [self._cut_words(new[0], budget - self.count_tokens(header))]
+                tokens = self.count_tokens(header + kept[0]) if kept[0] else 0
+                truncated = True
+            if kept and kept[0]:
+                parts.append(header + ' '.join(kept))
+                seen.update(_normalize(sentence) for sentence in kept)
+                used += 1
+            if truncated:
+                break
+
+        text = '\n'.join(parts) + '\n' if parts else ''
+        # Текст целиком повторно не токенизируется: число токенов - сумма стоимостей включенных предложений
+        return PackedContext(text=text, tokens=tokens, passages=used,
+                             duplicates=duplicates, truncated=truncated)
+
+    def trim(self, text: str, max_tokens: Optional[int] = None) -> str:
+        """
+        Обрезает готовый текст по границе предложения, если он не влезает в бюджет.
+        Длина префикса растет вместе с числом предложений, поэтому граница ищется двоичным поиском:
+        токенизатор вызывается O(log n) раз, а не для каждого предложения
+        :param text: контекст
+        :param max_tokens: бюджет токенов (по умолчанию self.max_tokens)
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        if self.count_tokens(text) <= budget:
+            return text
+        lines = [split_sentences(line) for line in text.splitlines()]
+        # Границы - концы предложений: (номер строки, число предложений строки в префиксе)
+        bounds = [(row, end) for row, sentences in enumerate(lines) for end in range(1, len(sentences) + 1)]
+
+        def prefix(bound: int) -> str:
+            row, end = bounds[bound]
+            return '\n'.join([' '.join(sentences) for sentences in lines[:row]] + [' '.join(lines[row][:end])])
+
+        low, high = 0, len(bounds)
+        while low < high:
+            middle = (low + high) // 2
+            if self.count_tokens(prefix(middle)) <= budget:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            # Даже первое предложение не влезает - режем его по словам
+            return self._cut_words(lines[bounds[0][0]][0], budget) if bounds else ''
+        return prefix(low - 1)
+
+    def _cut_words(self, sentence: str, budget: int) -> str:
+        words = sentence.split()
+        while words and self.count_tokens(' '.join(words)) > budget:
+            words = words[:min(len(words) * budget // max(self.count_tokens(' '.join(words)), 1), len(words) - 1)]
+        return ' '.join(words)
@@ -0,0 +1,114 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к каноническому виду для ключа кэша
+    :param text: исходный текст
+    :return: текст в NFC без лишних пробельных символов
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = 'embedding_cache.sqlite', max_entries: int = 100_000,
+                 touch_interval: float = 3600.0):
+        """
+        Дисковый кэш эмбеддингов на SQLite, адресуемый по содержимому.
+        Работает в режиме WAL, поэтому несколько процессов могут читать его одновременно
+        :param path: путь к файлу базы
+        :param max_entries: максимальное количество векторов; лишние вытесняются по LRU
+        :param touch_interval: время последнего обращения обновляется не чаще раза в touch_interval секунд,
+            чтобы чтение из кэша почти никогда не требовало записи
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f'{model_name}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """
+        Достает векторы по ключам
+        :param keys: ключи, полученные через make_key
+        :return: словарь ключ -> float32 вектор для найденных ключей
+        """
+        found = {}
+        stale = []
+        now = time.time()
+        with self._lock:
+            # SQLite ограничивает число параметров запроса, поэтому идем порциями
+            for pos in range(0, len(keys), 500):
+                part = keys[pos:pos + 500]
+                rows = self._conn.execute(
+                    f'SELECT key, vector, last_access FROM embeddings WHERE key IN ({",".join("?" * len(part))})',
+                    part
+                ).fetchall()
+                for key, blob, last_access in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    if now - last_access > self.touch_interval:
+                        stale.append(key)
+            # Для LRU достаточно точности touch_interval: горячие записи не переписываются на каждом чтении
+            if stale:
+                self._conn.executemany('UPDATE embeddings SET last_access = ? WHERE key = ?',
+                                       [(now, key) for key in stale])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]) -> None:
+        """
+        Сохраняет векторы и вытесняет самые давно использованные записи сверх лимита
+        :param items: словарь ключ -> вектор
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, int(vector.shape[-1]), np.ascontiguousarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)', rows)
+            excess = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    'DELETE FROM embeddings WHERE key IN '
+                    '(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)',
+                    (excess,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
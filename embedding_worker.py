@@ -1,16 +1,57 @@
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Iterable, Optional
 import numpy as np
+import os
 import time
 
+from embedding_cache import EmbeddingCache
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# torch - исходная модель PyTorch fp32, onnx - ONNX Runtime,
+# int8 - динамическая int8-квантизация линейных слоев для CPU
+EMBEDDER_BACKENDS = ('torch', 'onnx', 'int8')
+
+
 class TextEmbedder:
-    def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2', memory_budget_mb: int = 256,
+                 cache: Optional[EmbeddingCache] = None, backend: Optional[str] = None):
         """
         Инициализация модели для преобразования текст <-> эмбеддинг
         :param model_name: название модели Sentence Transformers
+        :param memory_budget_mb: бюджет памяти (в МБ) на один батч при пакетном кодировании
+        :param cache: дисковый кэш эмбеддингов (если None, кэш не используется)
+        :param backend: бэкенд инференса из EMBEDDER_BACKENDS (если None, берется из EMBEDDER_BACKEND или 'torch')
         """
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.backend = backend or os.getenv('EMBEDDER_BACKEND', 'torch')
+        if self.backend not in EMBEDDER_BACKENDS:
+            raise ValueError(f'Неизвестный бэкенд {self.backend}, доступны: {EMBEDDER_BACKENDS}')
+        # Векторы разных бэкендов немного отличаются, поэтому в кэше они хранятся раздельно
+        self.cache_namespace = model_name if self.backend == 'torch' else f'{model_name}:{self.backend}'
+        self.cache = cache
+        self.model = self._load_model()
         # Для простоты будем считать, что размерность эмбеддинга фиксирована
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.memory_budget_mb = memory_budget_mb
+        # Скорость последнего пакетного кодирования (текстов в секунду)
+        self.last_throughput = 0.0
+
+    def _load_model(self) -> "SentenceTransformer":
+        # Импорт sentence_transformers (и torch) откладывается до создания модели
+        from sentence_transformers import SentenceTransformer
+        if self.backend == 'onnx':
+            return SentenceTransformer(self.model_name, backend='onnx')
+
+        model = SentenceTransformer(self.model_name, device='cpu' if self.backend == 'int8' else None)
+        if self.backend == 'int8':
+            import torch
+            # Квантуются только веса nn.Linear; пулинг и нормализация остаются прежними,
+            # поэтому размерность и масштаб векторов не меняются
+            model[0].auto_model = torch.quantization.quantize_dynamic(
+                model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return model
 
     def text_to_embedding(self, text: str) -> np.ndarray:
         """
@@ -18,8 +59,130 @@ class TextEmbedder:
         :param text: входной текст
         :return: numpy массив с эмбеддингом (размерность зависит от модели)
         """
+        if self.cache is not None:
+            return self.texts_to_embeddings([text])[0]
         return self.model.encode(text, convert_to_tensor=False)
 
+    def _batch_size_for(self, seq_len: int) -> int:
+        """
+        Подбирает размер батча так, чтобы активации трансформера укладывались в бюджет памяти
+        :param seq_len: длина самой длинной последовательности батча в токенах
+        :return: количество текстов в батче
+        """
+        # Грубая оценка: на каждый токен приходится ~ hidden * слои * 4 байта * запас на внимание
+        first_module = self.model[0]
+        config = getattr(getattr(first_module, 'auto_model', None), 'config', None)
+        hidden = getattr(config, 'hidden_size', self.embedding_dim)
+        layers = getattr(config, 'num_hidden_layers', 12)
+        bytes_per_text = max(seq_len, 1) * hidden * layers * 4 * 4
+        budget = self.memory_budget_mb * 1024 * 1024
+        return max(1, min(512, budget // bytes_per_text))
+
+    def texts_to_embeddings(self, texts: Iterable[str], batch_size: Optional[int] = None,
+                            verbose: bool = False) -> np.ndarray:
+        """
+        Пакетно преобразует тексты в эмбеддинги
+        :param texts: список или итератор текстов
+        :param batch_size: фиксированный размер батча (если None, подбирается по бюджету памяти)
+        :param verbose: печатать ли скорость кодирования
+        :return: непрерывная float32 матрица (len(texts), embedding_dim) в исходном порядке текстов
+        """
+        texts = list(texts)
+        result = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        if not texts:
+            return result
+
+        start = time.time()
+        total = len(texts)
+        if self.cache is not None:
+            keys = [EmbeddingCache.make_key(self.cache_namespace, text) for text in texts]
+            cached = self.cache.get_many(keys)
+            for i, key in enumerate(keys):
+                if key in cached:
+                    result[i] = cached[key]
+            missing = [i for i, key in enumerate(keys) if key not in cached]
+            if missing:
+                vectors = self._encode_batched([texts[i] for i in missing], batch_size)
+                result[missing] = vectors
+                self.cache.put_many({keys[i]: vectors[j] for j, i in enumerate(missing)})
+        else:
+            result[:] = self._encode_batched(texts, batch_size)
+
+        elapsed = time.time() - start
+        self.last_throughput = total / elapsed if elapsed > 0 else float('inf')
+        if verbose:
+            print(f'Закодировано {total} текстов за {elapsed:.2f} сек '
+                  f'({self.last_throughput:.1f} текстов/сек)')
+            if self.cache is not None:
+                print(f'Кэш эмбеддингов: {self.cache.stats()}')
+        return result
+
+    def _encode_batched(self, texts: list[str], batch_size: Optional[int]) -> np.ndarray:
+        result = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        tokenizer = self.model.tokenizer
+        max_seq_length = self.model.max_seq_length or 512
+        lengths = [
+            min(len(ids), max_seq_length)
+            for ids in tokenizer(texts, add_special_tokens=True, truncation=False)['input_ids']
+        ]
+        # Сортировка по длине уменьшает паддинг внутри батча (от длинных к коротким)
+        order = sorted(range(len(texts)), key=lambda i: -lengths[i])
+
+        pos = 0
+        while pos < len(order):
+            size = batch_size or self._batch_size_for(lengths[order[pos]])
+            batch_idx = order[pos:pos + size]
+            vectors = self.model.encode(
+                [texts[i] for i in batch_idx],
+                batch_size=len(batch_idx),
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            result[batch_idx] = vectors
+            pos += size
+        return result
+
+
+def compare_backends(texts: list[str],
+                     model_name: str = 'paraphrase-multilingual-MiniLM-L12-v2',
+                     backends: Iterable[str] = EMBEDDER_BACKENDS) -> dict:
+    """
+    Сравнивает бэкенды с эталонным fp32 PyTorch по скорости и отклонению векторов
+    :param texts: выборка текстов (например, статьи из tk_rf.json)
+    :param model_name: название модели Sentence Transformers
+    :param backends: проверяемые бэкенды
+    :return: словарь бэкенд -> скорость, ускорение и косинусная близость к эталону
+    """
+    def timed_encode(embedder: TextEmbedder) -> tuple[np.ndarray, float]:
+        embedder.texts_to_embeddings(texts[:8])  # прогрев
+        start = time.time()
+        vectors = embedder.texts_to_embeddings(texts)
+        return vectors, time.time() - start
+
+    def unit(m: np.ndarray) -> np.ndarray:
+        return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+    reference, reference_time = timed_encode(TextEmbedder(model_name, backend='torch'))
+    report = {}
+    for backend in backends:
+        if backend == 'torch':
+            vectors, elapsed = reference, reference_time
+        else:
+            vectors, elapsed = timed_encode(TextEmbedder(model_name, backend=backend))
+        if vectors.shape != reference.shape:
+            raise ValueError(f'Бэкенд {backend} изменил размерность: {vectors.shape} != {reference.shape}')
+        cosine = (unit(vectors) * unit(reference)).sum(axis=1)
+        norm_ratio = np.linalg.norm(vectors, axis=1) / np.maximum(np.linalg.norm(reference, axis=1), 1e-12)
+        report[backend] = {
+            'texts_per_sec': len(texts) / elapsed,
+            'speedup': reference_time / elapsed,
+            'cosine_mean': float(cosine.mean()),
+            'cosine_min': float(cosine.min()),
+            'norm_ratio_mean': float(norm_ratio.mean())
+        }
+        print(f'{backend}: {report[backend]}')
+    return report
+
 
 # Пример использования
 if __name__ == "__main__":
@@ -32,4 +195,20 @@ if __name__ == "__main__":
     start = time.time()
     embedding = embedder.text_to_embedding(text)
     print(f'timer: {time.time() - start}')
-    print(f"Эмбеддинг: {embedding[:5]}...")
\ No newline at end of file
+    print(f"Эмбеддинг: {embedding[:5]}...")
+
+    # Сравнение поштучного и пакетного кодирования на статьях ТК РФ
+    import json
+    with open('tk_rf.json', 'r', encoding='utf-8') as f:
+        articles = list(json.load(f).values())[:200]
+
+    start = time.time()
+    for article in articles:
+        embedder.text_to_embedding(article)
+    elapsed = time.time() - start
+    print(f'поштучно: {len(articles) / elapsed:.1f} текстов/сек')
+
+    embedder.texts_to_embeddings(articles, verbose=True)
+
+    # Проверка бэкендов: ускорение и отклонение от fp32 на выборке статей
+    compare_backends(articles[:100])
@@ -1,14 +1,27 @@
+from __future__ import annotations
+
+import hashlib
 import json
+import logging
+import os
+import queue
+import threading
+import time
 from pprint import pprint
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 
-from chromadb import ClientAPI
-from chromadb import Collection
-import chromadb
-
+from embedding_cache import EmbeddingCache
 from embedding_worker import TextEmbedder
+from query_cache import query_cache
+from answer_cache import invalidate_persisted_answers
+from tracing import tracer
+
+# chromadb нужен здесь только для аннотаций, поэтому импорт функций поиска не тянет тяжелые библиотеки
+# (embedding_worker загружает sentence_transformers лишь при создании модели)
+if TYPE_CHECKING:
+    from chromadb import ClientAPI, Collection
 
-embedder = TextEmbedder()
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
+logger = logging.getLogger(__name__)
 
 sentences = [
     'Посадил дед репку — выросла репка большая пребольшая',
@@ -27,26 +40,242 @@ def create_collection(name : str, client: ClientAPI):
 
 
 def fill_db_story(sentences: list[str], embedding_model: TextEmbedder, collection: Collection):
+    embeddings = embedding_model.texts_to_embeddings(sentences, verbose=True)
     for id, sentence in enumerate(sentences):
         collection.add(
-            embeddings=embedding_model.text_to_embedding(sentence),
+            embeddings=embeddings[id],
             ids=str(id),
             metadatas={'text': sentence}
         )
 
-def fill_db_from_json(json_data: dict, embedding_model: TextEmbedder, collection: Collection):
-    keys = list(json_data.keys())
-    for ind, key in enumerate(keys):
-        collection.add(embeddings=embedding_model.text_to_embedding(json_data[key]),
-                       ids=key,
-                       metadatas={
-                           'text': json_data[key],
-                           'article_number': key
-                       })
+def article_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _article_metadata(key: str, text: str) -> dict:
+    return {
+        'text': text,
+        'article_number': key,
+        'content_hash': article_hash(text)
+    }
+
+
+def _chunked(records: Iterable[tuple[str, str]], chunk_size: int) -> Iterator[list[tuple[str, str]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _upsert_with_retry(collection: Collection, ids: list[str], embeddings, metadatas: list[dict],
+                       max_retries: int, retry_delay: float) -> bool:
+    for attempt in range(max_retries + 1):
+        try:
+            collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+            return True
+        except Exception as e:
+            if attempt == max_retries:
+                print(f'Не удалось загрузить пакет {ids[0]}..{ids[-1]}: {e}')
+                return False
+            # Экспоненциальная задержка перед повтором
+            time.sleep(retry_delay * (2 ** attempt))
+    return False
+
+
+# Ключ метаданных коллекции, который меняется при каждой загрузке и синхронизации
+DATA_VERSION_KEY = 'data_version'
+
+
+def data_version(collection: Collection) -> int:
+    """Метка версии данных коллекции (0, если коллекцию еще не меняли этим модулем)"""
+    return (collection.metadata or {}).get(DATA_VERSION_KEY, 0)
+
+
+def _bump_data_version(collection: Collection) -> None:
+    # Синхронизация правит статьи, не меняя их числа: по метке процессы с локальными
+    # зеркалами коллекции (LocalIndexRegistry) понимают, что снимок устарел.
+    # Параметры hnsw:* задаются только при создании коллекции, Chroma не принимает их в modify
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith('hnsw:')}
+    metadata[DATA_VERSION_KEY] = time.time_ns()
+    collection.modify(metadata=metadata)
+
+
+def _invalidate_answers(collection: Collection) -> None:
+    _bump_data_version(collection)
+    query_cache.invalidate(collection.name)
+    # Кэш ответов на диске общий для процессов и ключуется названием коллекции Chroma;
+    # одноименная коллекция в памяти (заглушки, бенчмарки) не должна его сбрасывать
+    if not getattr(collection, 'in_memory', False):
+        invalidate_persisted_answers(collection.name)
+
+
+def fill_db_bulk(records: Iterable[tuple[str, str]],
+                 embedding_model: TextEmbedder,
+                 collection: Collection,
+                 chunk_size: int = 128,
+                 queue_size: int = 2,
+                 max_retries: int = 3,
+                 retry_delay: float = 1.0,
+                 make_metadata: Callable[[str, str], dict] = _article_metadata,
+                 on_chunk_done: Callable[[list[str]], None] | None = None) -> dict:
+    """
+    Пакетная загрузка в коллекцию конвейером: пока один поток кодирует следующий пакет,
+    другой отправляет предыдущий в Chroma одним upsert
+    :param records: пары (id, текст); может быть генератором
+    :param embedding_model: модель для получения эмбеддингов
+    :param collection: коллекция Chroma
+    :param chunk_size: количество записей в одном пакете
+    :param queue_size: максимальное число закодированных пакетов, ожидающих отправки
+    :param max_retries: количество повторов отправки пакета при ошибке
+    :param retry_delay: начальная задержка между повторами (сек)
+    :param make_metadata: функция, строящая метаданные записи по (id, текст)
+    :param on_chunk_done: вызывается с id записей каждого успешно загруженного пакета
+    :return: статистика загрузки
+    """
+    upload_queue = queue.Queue(maxsize=queue_size)
+    stats = {'added': 0, 'failed_ids': [], 'embed_time': 0.0, 'upload_time': 0.0}
+    errors = []
+    start = time.time()
+
+    def uploader():
+        try:
+            while True:
+                item = upload_queue.get()
+                if item is None:
+                    break
+                ids, embeddings, metadatas = item
+                upload_start = time.time()
+                if _upsert_with_retry(collection, ids, embeddings, metadatas, max_retries, retry_delay):
+                    stats['added'] += len(ids)
+                    if on_chunk_done is not None:
+                        on_chunk_done(ids)
+                else:
+                    stats['failed_ids'].extend(ids)
+                stats['upload_time'] += time.time() - upload_start
+
+                elapsed = time.time() - start
+                print(f'Загружено {stats["added"]} записей '
+                      f'({stats["added"] / elapsed:.1f} записей/сек)')
+        except Exception as e:
+            errors.append(e)
+
+    def put(item) -> None:
+        # Блокируется, если загрузчик не успевает, — так ограничивается расход памяти.
+        # Если загрузчик упал, очередь больше никто не разберет
+        while upload_thread.is_alive():
+            try:
+                upload_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    upload_thread = threading.Thread(target=uploader, daemon=True)
+    upload_thread.start()
+    try:
+        for chunk in _chunked(records, chunk_size):
+            if errors:
+                break
+            ids = [key for key, _ in chunk]
+            embed_start = time.time()
+            embeddings = embedding_model.texts_to_embeddings([text for _, text in chunk])
+            stats['embed_time'] += time.time() - embed_start
+            metadatas = [make_metadata(key, text) for key, text in chunk]
+            put((ids, embeddings, metadatas))
+    finally:
+        put(None)
+        upload_thread.join()
+        _invalidate_answers(collection)
+    if errors:
+        raise errors[0]
+
+    stats['total_time'] = time.time() - start
+    print(f'Итого: {stats["added"]} записей за {stats["total_time"]:.2f} сек '
+          f'(кодирование {stats["embed_time"]:.2f} сек, загрузка {stats["upload_time"]:.2f} сек), '
+          f'ошибок: {len(stats["failed_ids"])}')
+    return stats
+
+
+def fill_db_from_json(json_data: dict, embedding_model: TextEmbedder, collection: Collection,
+                      chunk_size: int = 128):
+    fill_db_bulk(json_data.items(),
+                 embedding_model=embedding_model,
+                 collection=collection,
+                 chunk_size=chunk_size)
 
     print(f'Данные добавлены в коллекцию: {collection.name}')
 
 
+def _stored_hashes(collection: Collection, manifest_path: str | None) -> dict[str, str]:
+    if manifest_path is not None and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    stored = collection.get(include=['metadatas'])
+    return {
+        key: (metadata or {}).get('content_hash', '')
+        for key, metadata in zip(stored['ids'], stored['metadatas'])
+    }
+
+
+def sync_from_json(json_data: dict, embedding_model: TextEmbedder, collection: Collection,
+                   manifest_path: str | None = None, chunk_size: int = 128) -> dict:
+    """
+    Инкрементальная синхронизация коллекции с новой редакцией ТК РФ:
+    перекодирует только добавленные и измененные статьи и удаляет исчезнувшие
+    :param json_data: словарь "Статья N" -> текст
+    :param embedding_model: модель для получения эмбеддингов
+    :param collection: коллекция Chroma
+    :param manifest_path: локальный манифест с хэшами статей (если None, хэши берутся из метаданных)
+    :param chunk_size: количество записей в одном пакете загрузки
+    :return: списки добавленных, измененных, удаленных и не загруженных статей
+    """
+    start = time.time()
+    stored = _stored_hashes(collection, manifest_path)
+    current = {key: article_hash(text) for key, text in json_data.items()}
+
+    added = [key for key in current if key not in stored]
+    changed = [key for key in current if key in stored and stored[key] != current[key]]
+    removed = [key for key in stored if key not in current]
+
+    failed = []
+    if added or changed:
+        stats = fill_db_bulk(((key, json_data[key]) for key in added + changed),
+                             embedding_model=embedding_model,
+                             collection=collection,
+                             chunk_size=chunk_size)
+        failed = stats['failed_ids']
+    for pos in range(0, len(removed), chunk_size):
+        collection.delete(ids=removed[pos:pos + chunk_size])
+    if removed:
+        _invalidate_answers(collection)
+
+    if manifest_path is not None:
+        # Для не загруженных статей остается прежний хэш (или записи нет),
+        # чтобы следующая синхронизация повторила их загрузку
+        manifest = dict(current)
+        for key in failed:
+            if key in stored:
+                manifest[key] = stored[key]
+            else:
+                del manifest[key]
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    summary = {'added': added, 'changed': changed, 'removed': removed, 'failed': failed}
+    print(f'Синхронизация {collection.name} за {time.time() - start:.2f} сек: '
+          f'добавлено {len(added)}, изменено {len(changed)}, удалено {len(removed)}, '
+          f'без изменений {len(current) - len(added) - len(changed)}, ошибок {len(failed)}')
+    for title, keys in (('Добавлены', added), ('Изменены', changed), ('Удалены', removed),
+                        ('Не загружены', failed)):
+        if keys:
+            print(f'{title}: {", ".join(keys)}')
+    return summary
+
+
 def get_full_info_sentence_embeddings(embedding: list[float], collection: Collection, n_results: int = 3):
     requests = collection.query(embedding, n_results=n_results)
     result_dict = {
@@ -65,21 +294,32 @@ def get_full_info_sentence_embeddings(embedding: list[float], collection: Collec
     return result_dict
 
 
+def get_passages_by_embedding(embedding: list[float], collection: Collection,
+                              n_results: int = 3) -> list[tuple[str, float]]:
+    """Найденные фрагменты в виде пар (текст, расстояние) для ContextPacker"""
+    with tracer.span('vector_query', collection=collection.name, n_results=n_results):
+        requests = collection.query(embedding, n_results=n_results)
+    return [
+        (metadata['text'], distance)
+        for metadata, distance in zip(requests['metadatas'][0], requests['distances'][0])
+    ]
+
+
 def get_sentences_by_embedding(embedding: list[float], collection: Collection, n_results: int = 3) -> str:
-    requests = collection.query(embedding, n_results=n_results)
     formatted_text = ''
-    print("результат векторного поиска:")
-    for ind, text in enumerate(requests['metadatas'][0]):
-        print(ind,
-              # text['article_number'],
-              "\n", text['text'])
-        t = text['text']
+    for ind, (t, _) in enumerate(get_passages_by_embedding(embedding, collection, n_results)):
         formatted_text += f'{ind+1}. {t}\n'
+    logger.debug('Результат векторного поиска:\n%s', formatted_text)
 
     return formatted_text
 
 
 if __name__ == '__main__':
+    from chroma_access import get_chroma
+
+    embedder = TextEmbedder(cache=EmbeddingCache())
+    chroma_client = get_chroma()
+
     print(chroma_client.heartbeat())
     print(chroma_client.database)
     print(chroma_client.list_collections())
@@ -141,6 +381,10 @@ if __name__ == '__main__':
     #     data = json.load(f)
     #     fill_db_from_json(data, collection=collection, embedding_model=embedder)
     #
+    # # После изменений в ТК РФ достаточно синхронизировать только разницу
+    # with open('tk_rf.json', 'r', encoding='utf-8') as f:
+    #     sync_from_json(json.load(f), collection=collection, embedding_model=embedder)
+    #
     # print(chroma_client.list_collections())
 
     # pprint(collection.query(query_embeddings=embedder.text_to_embedding('как уволиться с работы?'), n_results=2))
\ No newline at end of file
@@ -0,0 +1,174 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+# torch нужен только самой модели, планировщик работает с любым объектом с ask_batch
+if TYPE_CHECKING:
+    from llm_widget import LanguageModel
+
+
+@dataclass
+class _GenerationRequest:
+    question: str
+    document: str
+    temperature: float
+    max_length: int
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.time)
+
+    @property
+    def group(self) -> tuple[float, int]:
+        # В один вызов generate попадают только запросы с одинаковыми параметрами генерации
+        return self.temperature, self.max_length
+
+
+class GenerationScheduler:
+    def __init__(self, lm: "LanguageModel", max_batch_size: int = 4, max_wait_ms: float = 20.0):
+        """
+        Планировщик микробатчей перед LanguageModel: запросы, пришедшие в пределах короткого окна,
+        объединяются в один батч generate с левым паддингом, результаты раздаются вызывающим
+        :param lm: языковая модель
+        :param max_batch_size: максимальный размер батча
+        :param max_wait_ms: сколько ждать дополнительных запросов после первого (мс)
+        """
+        self.lm = lm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue[_GenerationRequest] = queue.Queue()
+        self._carry: list[_GenerationRequest] = []
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'generated_tokens': 0, 'generation_time': 0.0,
+                       'queue_wait_total': 0.0, 'queue_wait_max': 0.0}
+        self._closed = False
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, daemon=True, name='generation-scheduler')
+        self._worker.start()
+
+    def submit(self, question: str, document: str, temperature: float = 0.7, max_length: int = 100) -> Future:
+        """
+        Ставит вопрос в очередь генерации
+        :return: Future с текстом ответа
+        """
+        if self._closed:
+            raise RuntimeError('Планировщик остановлен')
+        request = _GenerationRequest(question, document, temperature, max_length)
+        self._queue.put(request)
+        return request.future
+
+    def ask(self, question: str, document: str, temperature: float = 0.7, max_length: int = 100, **kwargs) -> str:
+        """Блокирующий вызов с той же сигнатурой, что и LanguageModel.ask"""
+        return self.submit(question, document, temperature, max_length).result()
+
+    def _collect_batch(self) -> list[_GenerationRequest]:
+        if self._stopping and not self._carry:
+            return []
+        pending = self._carry or [self._queue.get()]
+        self._carry = []
+        deadline = time.time() + self.max_wait
+        while len(pending) < self.max_batch_size * 2 and None not in pending:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        if None in pending:
+            # Сигнал остановки: дорабатываем то, что уже в очереди
+            self._stopping = True
+            pending = [request for request in pending if request is not None]
+            if not pending:
+                return []
+
+        # Берем группу самого старого запроса, остальные переносим в следующий батч
+        group = pending[0].group
+        batch = [request for request in pending if request.group == group][:self.max_batch_size]
+        self._carry = [request for request in pending if request not in batch]
+        return batch
+
+    @staticmethod
+    def _resolve(future: Future, answer: Optional[str] = None, error: Optional[Exception] = None) -> None:
+        # Future мог завершиться в обход планировщика - это не должно останавливать рабочий поток
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(answer)
+        except InvalidStateError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+            # Отмененные вызывающим запросы не генерируем; остальные Future больше нельзя отменить
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.time()
+            try:
+                results = self.lm.ask_batch(
+                    [(request.question, request.document) for request in batch],
+                    temperature=batch[0].temperature,
+                    max_length=batch[0].max_length,
+                    return_token_counts=True
+                )
+            except Exception as e:
+                for request in batch:
+                    self._resolve(request.future, error=e)
+                continue
+            elapsed = time.time() - started
+
+            with self._stats_lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['generated_tokens'] += sum(count for _, count in results)
+                self._stats['generation_time'] += elapsed
+                for request in batch:
+                    wait = started - request.enqueued_at
+                    self._stats['queue_wait_total'] += wait
+                    self._stats['queue_wait_max'] = max(self._stats['queue_wait_max'], wait)
+            for request, (answer, _) in zip(batch, results):
+                self._resolve(request.future, answer)
+
+    def stats(self) -> dict:
+        """Пропускная способность (токенов/сек), средний размер батча и ожидание в очереди"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['tokens_per_sec'] = stats['generated_tokens'] / stats['generation_time'] \
+            if stats['generation_time'] else 0.0
+        stats['avg_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_wait_avg'] = stats['queue_wait_total'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def close(self) -> None:
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from llm_widget import LanguageModel
+
+    lm = LanguageModel("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+    scheduler = GenerationScheduler(lm, max_batch_size=4, max_wait_ms=50)
+    questions = [f"Сколько дней длится отпуск? ({i})" for i in range(8)]
+    document = "Ежегодный основной оплачиваемый отпуск предоставляется работникам продолжительностью 28 календарных дней."
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=len(questions)) as executor:
+        list(executor.map(lambda q: scheduler.ask(q, document, max_length=64), questions))
+    print(f'С планировщиком: {time.time() - start:.2f} сек, {scheduler.stats()}')
+
+    start = time.time()
+    for question in questions:
+        lm.ask(question, document, max_length=64)
+    print(f'По одному: {time.time() - start:.2f} сек')
+    scheduler.close()
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+SYSTEM_PROMPT = "Ты ассистент, который отвечает на вопросы пользователя, оперируя только следующей информацией\n{context}"
+
+
+def build_messages(question: str, context: str) -> list:
+    """Сообщения для GigaChat: системное с найденным контекстом и вопрос пользователя"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    return [
+        SystemMessage(content=SYSTEM_PROMPT.format(context=context)),
+        HumanMessage(content=question)
+    ]
+
+
+def create_gigachat():
+    """
+    Клиент GigaChat. Если задан GIGACHAT_BASE_URL (например, локальная заглушка gigachat_stub.py),
+    запросы идут туда с фиктивным токеном
+    """
+    from langchain_gigachat import GigaChat
+    base_url = os.getenv("GIGACHAT_BASE_URL")
+    if base_url:
+        return GigaChat(base_url=base_url, access_token="stub", verify_ssl_certs=False,
+                        timeout=float(os.getenv("GIGACHAT_TIMEOUT", "30")))
+    return GigaChat(
+        credentials=os.getenv("GIGACHAT_AUTH_DATA_V"),
+        scope="GIGACHAT_API_PERS",
+        verify_ssl_certs=False,
+        profanity_check=False,
+        timeout=float(os.getenv("GIGACHAT_TIMEOUT", "30"))
+    )
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Размыкатель: после failure_threshold ошибок подряд запросы сразу отклоняются на reset_timeout секунд,
+        затем пропускается один пробный запрос
+        :param failure_threshold: ошибок подряд до размыкания
+        :param reset_timeout: время до пробного запроса (сек)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.time() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probe or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self._probe = False
+
+    def release(self) -> None:
+        """Вызов отменен без результата: пробный запрос можно пропустить снова"""
+        with self._lock:
+            self._probe = False
+
+
+class GigaChatGateway:
+    def __init__(self, client_factory: Callable[[], Any] = create_gigachat, max_concurrency: int = 8,
+                 max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 attempt_timeout: float = 60.0, breaker: Optional[CircuitBreaker] = None):
+        """
+        Общий для процесса шлюз к GigaChat: один клиент (и его пул соединений) на всех потребителей,
+        асинхронные вызовы ainvoke/astream на собственном цикле событий, ограничение одновременных
+        запросов, повторы с экспоненциальной задержкой и джиттером, размыкатель и метрики
+        :param client_factory: функция, создающая клиент (GigaChat или заглушку с ainvoke/astream)
+        :param max_concurrency: максимум одновременных запросов к API
+        :param max_retries: повторов после неудачной попытки
+        :param base_delay: начальная задержка перед повтором (сек)
+        :param max_delay: максимальная задержка перед повтором (сек)
+        :param attempt_timeout: таймаут одной попытки (сек)
+        :param breaker: размыкатель (по умолчанию CircuitBreaker())
+        """
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=1000)
+        self._stats = {'calls': 0, 'errors': 0, 'retries': 0, 'rejected': 0, 'in_flight': 0}
+
+    @property
+    def client(self):
+        # Клиент создается один раз при первом запросе
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(target=self._loop.run_forever, daemon=True, name='gigachat-gateway').start()
+            return self._loop
+
+    def _backoff(self, attempt: int) -> float:
+        # Полный джиттер: одновременные клиенты не повторяют запросы синхронно
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    async def _call(self, attempt_func: Callable[[], Any], can_retry: Callable[[], bool] = lambda: True):
+        """
+        Выполняет запрос с повторами. Для размыкателя это один вызов: ошибка засчитывается,
+        только когда повторы исчерпаны
+        :param attempt_func: возвращает корутину одной попытки
+        :param can_retry: можно ли повторять после ошибки (например, пока не отдано ни одного фрагмента)
+        """
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError("GigaChat временно недоступен: слишком много ошибок подряд")
+        for attempt in range(self.max_retries + 1):
+            self._count('calls')
+            self._count('in_flight')
+            try:
+                async with self._semaphore:
+                    # Задержка считается без ожидания свободного слота
+                    start = time.time()
+                    result = await asyncio.wait_for(attempt_func(), self.attempt_timeout)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception:
+                self._count('errors')
+                if attempt == self.max_retries or not can_retry():
+                    self.breaker.record_failure()
+                    raise
+                self._count('retries')
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            finally:
+                self._count('in_flight', -1)
+            self.breaker.record_success()
+            with self._stats_lock:
+                self._latencies.append(time.time() - start)
+            return result
+
+    async def _ainvoke(self, question: str, context: str) -> str:
+        messages = build_messages(question, context)
+        message = await self._call(lambda: self.client.ainvoke(messages))
+        return message.content
+
+    def submit(self, question: str, context: str) -> Future:
+        """
+        Запускает запрос на цикле событий шлюза
+        :return: Future с текстом ответа; его отмена прерывает запрос к API
+        """
+        return asyncio.run_coroutine_threadsafe(self._ainvoke(question, context), self._ensure_loop())
+
+    async def ask(self, question: str, context: str) -> str:
+        """
+        Асинхронный ответ GigaChat; можно вызывать из любого цикла событий
+        :param question: вопрос пользователя
+        :param context: найденный контекст
+        """
+        return await asyncio.wrap_future(self.submit(question, context))
+
+    def invoke(self, question: str, context: str) -> str:
+        """Блокирующий вариант ask для рабочих потоков"""
+        return self.submit(question, context).result()
+
+    def stream(self, question: str, context: str, stop_event: Optional[threading.Event] = None,
+               poll_interval: float = 0.1) -> Iterator[str]:
+        """
+        Потоковый ответ для рабочих потоков. Повтор возможен только до первого фрагмента,
+        чтобы пользователь не увидел начало ответа дважды
+        :param stop_event: событие отмены: чтение прекращается, не дожидаясь следующего фрагмента
+        :param poll_interval: как часто проверять stop_event, пока фрагментов нет (сек)
+        """
+        chunks: queue.Queue = queue.Queue()
+        done = object()
+        messages = build_messages(question, context)
+
+        emitted = False
+
+        async def attempt():
+            nonlocal emitted
+            async for chunk in self.client.astream(messages):
+                emitted = True
+                chunks.put(chunk.content)
+
+        async def produce():
+            try:
+                await self._call(attempt, can_retry=lambda: not emitted)
+            except Exception as e:
+                chunks.put(e)
+            chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._ensure_loop())
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=poll_interval)
+                except queue.Empty:
+                    # Первый фрагмент может идти долго (повторы, очередь к API) - отмена не должна его ждать
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    continue
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Потребитель мог прервать чтение (отмена в GUI) - запрос к API больше не нужен
+            future.cancel()
+
+    def stats(self) -> dict:
+        """Количество вызовов, ошибок, повторов и отклонений, задержки попыток и состояние размыкателя"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = np.array(self._latencies)
+        stats['error_rate'] = stats['errors'] / stats['calls'] if stats['calls'] else 0.0
+        stats['latency_p50'] = float(np.percentile(latencies, 50)) if len(latencies) else None
+        stats['latency_p95'] = float(np.percentile(latencies, 95)) if len(latencies) else None
+        stats['circuit'] = self.breaker.state
+        return stats
+
+    def close(self) -> None:
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+
+# Единый шлюз процесса
+gigachat_gateway = GigaChatGateway(max_concurrency=int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "8")))
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+
+def create_stub_app(latency: float = 0.5, jitter: float = 0.2, failure_rate: float = 0.05,
+                    timeout_rate: float = 0.0) -> FastAPI:
+    """
+    Локальная заглушка API GigaChat (/chat/completions, обычный и потоковый режим) для офлайн-замеров
+    пропускной способности и устойчивости GigaChatGateway
+    :param latency: средняя задержка ответа (сек)
+    :param jitter: разброс задержки (сек)
+    :param failure_rate: доля ответов с ошибкой 500/429
+    :param timeout_rate: доля запросов, которые "зависают" в 20 раз дольше обычного
+    """
+    app = FastAPI(title="GigaChatStub")
+
+    async def simulate():
+        delay = max(0.0, random.gauss(latency, jitter))
+        if random.random() < timeout_rate:
+            delay *= 20
+        await asyncio.sleep(delay)
+        if random.random() < failure_rate:
+            raise HTTPException(status_code=random.choice([429, 500]), detail="stub failure")
+
+    def completion(content: str, chunk: bool = False) -> dict:
+        key = "delta" if chunk else "message"
+        return {
+            "id": str(uuid.uuid4()),
+            "object": "chat.completion.chunk" if chunk else "chat.completion",
+            "created": int(time.time()),
+            "model": "GigaChat-stub",
+            "choices": [{"index": 0, key: {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()),
+                      "total_tokens": len(content.split())}
+        }
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        question = body["messages"][-1]["content"]
+        await simulate()
+        answer = f"[stub] Ответ на вопрос: {question}"
+        if not body.get("stream"):
+            return completion(answer)
+
+        async def events():
+            for word in answer.split(" "):
+                await asyncio.sleep(latency / 20)
+                yield f"data: {json.dumps(completion(word + ' ', chunk=True), ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "GigaChat-stub", "object": "model", "owned_by": "stub"}]}
+
+    return app
+
+
+async def benchmark(requests: int = 200, concurrency: int = 32, max_concurrency: int = 8) -> dict:
+    """
+    Нагрузка на заглушку через GigaChatGateway (GIGACHAT_BASE_URL должен указывать на заглушку)
+    :return: пропускная способность, перцентили задержки и метрики шлюза
+    """
+    from gigachat_gateway import GigaChatGateway
+
+    gateway = GigaChatGateway(max_concurrency=max_concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.time()
+            try:
+                await gateway.ask(f"Вопрос {i}", "Контекст")
+            except Exception:
+                errors += 1
+            latencies.append(time.time() - start)
+
+    start = time.time()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.time() - start
+    gateway.close()
+
+    latencies = np.array(latencies)
+    report = {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "gateway": gateway.stats()
+    }
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка GigaChat и замер шлюза")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=8090)
+    serve_parser.add_argument("--latency", type=float, default=0.5)
+    serve_parser.add_argument("--jitter", type=float, default=0.2)
+    serve_parser.add_argument("--failure-rate", type=float, default=0.05)
+    serve_parser.add_argument("--timeout-rate", type=float, default=0.0)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--url", default="http://localhost:8090")
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=32)
+    bench_parser.add_argument("--max-concurrency", type=int, default=8, help="ограничение шлюза")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import uvicorn
+        uvicorn.run(create_stub_app(args.latency, args.jitter, args.failure_rate, args.timeout_rate),
+                    host="127.0.0.1", port=args.port)
+    else:
+        os.environ["GIGACHAT_BASE_URL"] = args.url
+        asyncio.run(benchmark(args.requests, args.concurrency, args.max_concurrency))
@@ -1,43 +1,127 @@
-from pprint import pprint
-
-from llm_widget import LanguageModel
-import chromadb
-from chromadb import ClientAPI
-from embedding_worker import TextEmbedder
+import time
 
-from fill_db_story import get_sentences_by_embedding
-from langchain_gigachat import GigaChat
-from langchain_core.messages import HumanMessage, SystemMessage
+# Точка отсчета для замеров холодного старта
+PROCESS_START = time.perf_counter()
+
+# Тяжелые библиотеки (torch, transformers, chromadb, sentence_transformers, langchain_gigachat)
+# импортируются лениво - в фоновых потоках прогрева или при первом использовании
+from embedding_cache import EmbeddingCache
+from fill_db_story import get_passages_by_embedding
+from context_packer import ContextPacker, approximate_token_count
+from gigachat_gateway import SYSTEM_PROMPT, gigachat_gateway
+from query_cache import query_cache
+from local_index import LocalIndexRegistry
+from chroma_access import get_chroma
+from tracing import tracer
+from answer_cache import SemanticAnswerCache
+from model_registry import model_registry
 from dotenv import load_dotenv
+import json
+import logging
 import os
+import sys
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-from typing import Union
-import time
+from typing import TYPE_CHECKING, Callable, Optional, Union
 import threading
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+
+if TYPE_CHECKING:
+    from chromadb import ClientAPI
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+EMBEDDER_MODEL = 'embedder'
+
+
+def register_models():
+    """Регистрирует модели в общем реестре; неиспользуемые выгружаются через MODEL_IDLE_TIMEOUT секунд"""
+    idle_timeout = float(os.getenv("MODEL_IDLE_TIMEOUT", "1800"))
+
+    def load_embedder():
+        from embedding_worker import TextEmbedder
+        return TextEmbedder(cache=EmbeddingCache())
+
+    def load_tinyllama():
+        from llm_widget import LanguageModel
+        return LanguageModel("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+
+    model_registry.register(EMBEDDER_MODEL, load_embedder, idle_timeout)
+    model_registry.register('TinyLlama', load_tinyllama, idle_timeout)
+
+
+# Общий для панелей кэш ответов на близкие по смыслу вопросы
+answer_cache = SemanticAnswerCache()
+
+# У GigaChat нет локального токенизатора - бюджет контекста считается по оценке
+gigachat_packer = ContextPacker(approximate_token_count, int(os.getenv("GIGACHAT_CONTEXT_TOKENS", "1500")))
+
+COLLECTIONS = {"ТК РФ": "tk_rf",
+               "Репка": "fairy_tale"}
+
+
+def get_collection(client: "ClientAPI", local_indexes: Optional[LocalIndexRegistry], collection_name: str):
+    # Если задан реестр локальных индексов, поиск идет по зеркалу коллекции без обращения к серверу
+    with tracer.span('collection_lookup', collection=collection_name):
+        if local_indexes is not None:
+            return local_indexes.get(collection_name)
+        return client.get_collection(collection_name)
+
+
+def embed_question(question: str):
+    with tracer.span('embedding'), model_registry.use(EMBEDDER_MODEL) as embedder:
+        return query_cache.get_embedding(question, embedder)
+
+
+def search_passages(question: str, embedding, collection, n_results: int = 3) -> tuple[list[tuple[str, float]], float]:
+    """Фрагменты по вопросу и время их получения; результаты, полученные до сброса коллекции, не используются"""
+    return query_cache.get_timed_result(
+        question=question,
+        collection=collection,
+        n_results=n_results,
+        compute=lambda: get_passages_by_embedding(
+            embedding=embedding,
+            collection=collection,
+            n_results=n_results
+        ),
+        # Коллекцию мог перезагрузить другой процесс (sync_from_json): его сброс виден через кэш ответов
+        not_before=answer_cache.invalidated_at(collection.name)
+    )
+
+
+def retrieve_context(question: str, collection_name: str, client: "ClientAPI",
+                     local_indexes: Optional[LocalIndexRegistry]):
+    """Поиск контекста один раз для нескольких панелей: (коллекция, эмбеддинг вопроса, фрагменты, время поиска)"""
+    collection = get_collection(client, local_indexes, collection_name)
+    embedding = embed_question(question)
+    return (collection, embedding) + search_passages(question, embedding, collection)
+
 
 class LLMWidget(tk.Frame):
     def __init__(self, master,
                  widget_name_label: str,
-                 llm_model: Union[LanguageModel, str],
-                 client: Union[ClientAPI, None]):
+                 llm_model: str,
+                 client: Union["ClientAPI", None],
+                 local_indexes: Union[LocalIndexRegistry, None] = None):
         super().__init__(master=master)
         self.lm = llm_model
-        if self.lm == 'GigaChat':
-            self.chat = GigaChat(
-                credentials=os.getenv("GIGACHAT_AUTH_DATA_V"),
-                scope="GIGACHAT_API_PERS",
-                verify_ssl_certs=False,
-                profanity_check=False,
-                timeout=30
-            )
 
         self.chromo_client = client
-        self.embedder = TextEmbedder()
+        # Если задан, поиск идет по локальному зеркалу коллекции без обращения к серверу
+        self.local_indexes = local_indexes
         self.widget_name_label = widget_name_label
+        # У каждой панели свой рабочий поток: панели не блокируют ни интерфейс, ни друг друга
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=widget_name_label)
+        self.cancel_event = threading.Event()
+        # busy - панель отвечает на вопрос; locked - панель занята режимом сравнения
+        self.busy = False
+        self.locked = False
+        # Размер промпта последнего запроса (токенов), показывается рядом со временем ответа
+        self.prompt_tokens = None
 
         self.configure(bg='#f0f0f0', padx=10, pady=10)
         self.widget_configuration()
@@ -106,8 +190,17 @@ class LLMWidget(tk.Frame):
             style='TButton'
         )
 
+        self.cancel_button = ttk.Button(
+            self.question_frame,
+            text="Отмена",
+            command=self.on_cancel_button_clicked,
+            style='TButton',
+            state='disabled'
+        )
+
         self.question_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
         self.send_question_button.pack(side=tk.LEFT)
+        self.cancel_button.pack(side=tk.LEFT, padx=(5, 0))
         self.question_frame.grid(row=1, column=0, sticky="ew", pady=(0, 15))
 
         self.instruction_frame = ttk.Frame(self, style='TFrame')
@@ -207,57 +300,171 @@ class LLMWidget(tk.Frame):
         self.grid_rowconfigure(2, weight=0)
         self.grid_columnconfigure(0, weight=1)
 
+    def set_locked(self, locked: bool):
+        """Блокирует отправку вопросов из панели, пока идет сравнение моделей"""
+        self.locked = locked
+        self.send_question_button.config(state='disabled' if self.busy or self.locked else 'normal')
+
     def on_send_question_button_clicked(self):
+        if self.busy or self.locked:
+            return
         question = self.question_entry.get()
         if not question.strip():
             messagebox.showwarning("Предупреждение", "Введите вопрос перед отправкой")
             return
-
-        doc_dict = {"ТК РФ": "tk_rf",
-                    "Репка": "fairy_tale"}
-
+        self.start_answer(question, COLLECTIONS[self.db_selector.get()])
+
+    def start_answer(self, question: str, collection_name: str,
+                     retrieval: Optional[Future] = None) -> Optional[Future]:
+        """
+        Запускает ответ на вопрос в рабочем потоке панели
+        :param question: вопрос
+        :param collection_name: коллекция для поиска
+        :param retrieval: общий результат retrieve_context (режим сравнения), иначе панель ищет сама
+        :return: Future с ответом или None, если панель занята или введены некорректные параметры
+        """
+        if self.busy:
+            return None
         # Засекаем время начала
         start_time = time.time()
 
-        # Получаем выбранную базу данных
-        selected_db = self.db_selector.get()
-
-        collection = self.chromo_client.get_collection(doc_dict[selected_db])
-
+        # Значения виджетов читаем в потоке интерфейса, сама работа идет в фоне
         try:
-            result = get_sentences_by_embedding(
-                embedding=self.embedder.text_to_embedding(question),
-                collection=collection,
-                n_results=3
-            )
-            pprint(['Результат векторного поиска: \n', result])
-
+            temperature = float(self.temperature_entry.get()) if self.lm != 'GigaChat' else None
+        except ValueError:
+            messagebox.showwarning("Предупреждение", "Некорректное значение температуры")
+            return None
+
+        self.busy = True
+        self.cancel_event = threading.Event()
+        self.send_question_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self._set_dialog_text("Обработка запроса...")
+
+        # Фрагменты ответа передаются из рабочего потока в поток интерфейса через очередь
+        chunks = queue.Queue()
+        future = self.executor.submit(
+            self._answer_question, question, collection_name, temperature, self.cancel_event, chunks.put, retrieval
+        )
+        self.after(50, self._poll_answer, future, chunks, start_time, self.cancel_event, None)
+        return future
+
+    def on_cancel_button_clicked(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+
+    @tracer.traced
+    def _answer_question(self, question: str, collection_name: str, temperature,
+                         cancel_event: threading.Event, on_chunk: Callable[[str], None],
+                         retrieval: Optional[Future] = None) -> str:
+        """Поиск и генерация ответа; выполняется в рабочем потоке, к виджетам не обращается"""
+        self.prompt_tokens = None
+        start_time = time.time()
+        if retrieval is not None:
+            # Поиск уже выполнен один раз для обеих панелей
+            collection, embedding, passages, retrieved_at = retrieval.result()
+        else:
+            collection = get_collection(self.chromo_client, self.local_indexes, collection_name)
+            embedding = embed_question(question)
+            passages = None
+        # Близкий вопрос уже задавали - отдаем сохраненный ответ без поиска и генерации
+        cached_answer = answer_cache.lookup(embedding, collection_name, self.widget_name_label,
+                                            version=str(collection.id))
+        if cached_answer is not None:
+            on_chunk(cached_answer)
+            return cached_answer
+
+        if passages is None:
+            passages, retrieved_at = search_passages(question, embedding, collection)
+        logger.debug('Результат векторного поиска: %s', passages)
+
+        if cancel_event.is_set():
+            return ""
+        with ExitStack() as stack:
             if not self.lm == 'GigaChat':
-                temperature = float(self.temperature_entry.get())
-                self.response = self.lm.ask(
+                # Модель загружается при первом вопросе и не выгружается, пока идет генерация
+                lm = stack.enter_context(model_registry.use(self.lm))
+                packed = lm.pack_context(question, passages)
+                self.prompt_tokens = packed.prompt_tokens
+                stream = lm.ask_stream(
                     question=question,
-                    document=result,
-                    temperature=temperature
+                    document=packed.text,
+                    temperature=temperature,
+                    stop_event=cancel_event
                 )
             else:
-                messages = [
-                    SystemMessage(
-                        content=f"Ты ассистент, который отвечает на вопросы пользователя, оперируя только следующей информацией\n{result}"),
-                    HumanMessage(content=question)
-                ]
-                self.response = self.chat.invoke(input=messages).content
-
-            self.dialog.config(state='normal')
-            self.dialog.delete("1.0", tk.END)
-            self.dialog.insert(tk.END, self.response)
-            self.dialog.config(state='disabled')
+                # Общий шлюз: один клиент на процесс, повторы и размыкатель при сбоях API
+                packed = gigachat_packer.pack(passages)
+                self.prompt_tokens = approximate_token_count(SYSTEM_PROMPT.format(context=packed.text) + question)
+                stream = gigachat_gateway.stream(question, packed.text, stop_event=cancel_event)
+
+            answer = []
+            for text in stream:
+                if cancel_event.is_set():
+                    break
+                answer.append(text)
+                on_chunk(text)
+        answer = "".join(answer)
+        if not cancel_event.is_set() and answer.strip():
+            answer_cache.store(question, embedding, collection_name, self.widget_name_label, answer,
+                               latency=time.time() - start_time, version=str(collection.id),
+                               retrieved_at=retrieved_at)
+        return answer
+
+    def _set_dialog_text(self, text: str):
+        self.dialog.config(state='normal')
+        self.dialog.delete("1.0", tk.END)
+        self.dialog.insert(tk.END, text)
+        self.dialog.config(state='disabled')
 
+    def _append_dialog_text(self, text: str):
+        self.dialog.config(state='normal')
+        self.dialog.insert(tk.END, text)
+        self.dialog.see(tk.END)
+        self.dialog.config(state='disabled')
+
+    def _poll_answer(self, future: Future, chunks: queue.Queue, start_time: float,
+                     cancel_event: threading.Event, first_token_time: Optional[float]):
+        """Дописывает пришедшие фрагменты ответа и проверяет готовность фоновой задачи, не блокируя цикл событий Tk"""
+        # Проверяем done() до чтения очереди: после завершения задачи новых фрагментов уже не будет
+        done = future.done()
+        if not chunks.empty():
+            with tracer.span('ui_render'):
+                while not chunks.empty():
+                    text = chunks.get_nowait()
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        self._set_dialog_text("")
+                    self._append_dialog_text(text)
+
+        if not done:
+            self.after(50, self._poll_answer, future, chunks, start_time, cancel_event, first_token_time)
+            return
+
+        self.busy = False
+        self.send_question_button.config(state='disabled' if self.locked else 'normal')
+        self.cancel_button.config(state='disabled')
+        try:
+            self.response = future.result()
+            if cancel_event.is_set():
+                self._set_dialog_text(f"{self.response}\n\n[Запрос отменен]".strip())
+            elif first_token_time is None:
+                self._set_dialog_text(self.response)
         except Exception as e:
+            self._set_dialog_text("")
             messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
         finally:
-            # Обновляем время ответа
+            # Обновляем время ответа: время до первого токена и полное время
             response_time = time.time() - start_time
-            self.response_time_value.config(text=f"{response_time:.2f} сек")
+            first_token = f"{first_token_time:.2f}" if first_token_time is not None else "—"
+            prompt_tokens = f", промпт {self.prompt_tokens} ток." if self.prompt_tokens is not None else ""
+            cache_stats = query_cache.stats()['results']
+            answer_stats = answer_cache.stats()
+            self.response_time_value.config(
+                text=f"первый токен {first_token} сек, всего {response_time:.2f} сек{prompt_tokens} "
+                     f"(кэш поиска: {cache_stats['hit_rate']:.0%}, кэш ответов: {answer_stats['hit_rate']:.0%}, "
+                     f"сэкономлено {answer_stats['latency_saved']:.1f} сек)"
+            )
 
 
 class LoadingScreen:
@@ -307,62 +514,125 @@ class LoadingScreen:
 
 
 class LLMApplication:
-    def __init__(self):
+    def __init__(self, exit_when_ready: bool = False):
+        """
+        :param exit_when_ready: закрыть приложение после прогрева всех компонентов и вывести замеры (для бенчмарка)
+        """
+        self.exit_when_ready = exit_when_ready
+        self.startup_timings = {'import': time.perf_counter() - PROCESS_START}
+
         self.root = tk.Tk()
         self.root.title("LLM Chat Interface")
 
         # Показываем окно загрузки
         self.loading_screen = LoadingScreen(self.root)
-
-        # Запускаем загрузку в отдельном потоке
-        self.loading_thread = threading.Thread(
-            target=self._initialize_resources,
-            daemon=True
-        )
-        self.loading_thread.start()
+        self.interface_created = False
+
+        # Модели только регистрируются; прогрев всех компонентов идет параллельно
+        register_models()
+        warmup = [
+            ('chroma', self._connect_chroma),
+            ('embedder', lambda: model_registry.get(EMBEDDER_MODEL)),
+            ('GigaChat', lambda: gigachat_gateway.client)
+        ]
+        # WARMUP_LLM=0 оставляет TinyLlama незагруженной, пока ее панелью не воспользуются
+        if os.getenv("WARMUP_LLM", "1") == "1":
+            warmup.append(('TinyLlama', lambda: model_registry.get('TinyLlama')))
+        self.warmup_executor = ThreadPoolExecutor(max_workers=len(warmup), thread_name_prefix='warmup')
+        self.warmups = {
+            name: self.warmup_executor.submit(self._timed_warmup, name, func)
+            for name, func in warmup
+        }
 
         # Проверяем завершение загрузки
         self._check_loading_complete()
 
         self.root.mainloop()
 
-    def _initialize_resources(self):
-        """Инициализация ресурсоемких объектов"""
-        try:
-            # Инициализация клиента ChromaDB
-            self.chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
-            # Инициализация LanguageModel (может быть долгой)
-            self.lm = LanguageModel("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
-
-            self.initialization_success = True
-        except Exception as e:
-            self.initialization_error = str(e)
-            self.initialization_success = False
+    def _timed_warmup(self, name: str, func: Callable[[], object]):
+        start = time.perf_counter()
+        result = func()
+        self.startup_timings[f'{name}_load'] = time.perf_counter() - start
+        self.startup_timings[f'{name}_ready'] = time.perf_counter() - PROCESS_START
+        return result
+
+    def _connect_chroma(self):
+        """Подключение к ChromaDB; интерфейс показывается, как только оно готово"""
+        # Общий клиент с кэшем дескрипторов коллекций: вопрос - один запрос к серверу
+        self.chroma_client = get_chroma()
+        self.chroma_client.heartbeat()
+        self.local_indexes = LocalIndexRegistry(self.chroma_client) \
+            if os.getenv("LOCAL_VECTOR_INDEX") == "1" else None
 
     def _check_loading_complete(self):
         """Проверяем завершение загрузки и создаем интерфейс"""
-        if self.loading_thread.is_alive():
-            # Если загрузка еще идет, проверяем снова через 100 мс
-            self.root.after(2000, self._check_loading_complete)
-        else:
+        chroma = self.warmups['chroma']
+        if not self.interface_created and chroma.done():
             # Закрываем окно загрузки
             self.loading_screen.close()
 
-            if not self.initialization_success:
+            if chroma.exception() is not None:
                 # Показываем ошибку, если что-то пошло не так
                 tk.messagebox.showerror(
                     "Ошибка инициализации",
-                    f"Не удалось инициализировать приложение:\n{self.initialization_error}"
+                    f"Не удалось инициализировать приложение:\n{chroma.exception()}"
                 )
                 self.root.destroy()
                 return
 
-            # Создаем основной интерфейс
+            # Создаем основной интерфейс, модели догружаются в фоне
             self._create_interface()
+            self.interface_created = True
+            self.startup_timings['interactive'] = time.perf_counter() - PROCESS_START
+
+        if self.interface_created:
+            self._update_warmup_status()
+            if all(future.done() for future in self.warmups.values()):
+                self._on_warmup_complete()
+                return
+
+        self.root.after(100, self._check_loading_complete)
+
+    def _update_warmup_status(self):
+        parts = []
+        for name, future in self.warmups.items():
+            if not future.done():
+                parts.append(f"{name}: загрузка...")
+            elif future.exception() is not None:
+                parts.append(f"{name}: ошибка")
+            else:
+                parts.append(f"{name}: {self.startup_timings[f'{name}_load']:.1f} сек")
+        self.warmup_status.config(text="  |  ".join(parts))
+
+    def _on_warmup_complete(self):
+        for name, future in self.warmups.items():
+            if future.exception() is not None:
+                print(f"Не удалось прогреть {name}: {future.exception()}")
+        self.warmup_executor.shutdown(wait=False)
+        if self.exit_when_ready:
+            print(json.dumps(self.startup_timings, ensure_ascii=False))
+            self.root.destroy()
 
     def _create_interface(self):
         """Создание основного интерфейса приложения"""
+        self.warmup_status = ttk.Label(self.root, text="", font=('Arial', 9), foreground='#555555')
+        self.warmup_status.pack(side=tk.BOTTOM, fill=tk.X, padx=15)
+
+        # Режим сравнения: один вопрос обеим моделям, поиск выполняется один раз
+        compare_frame = ttk.Frame(self.root)
+        compare_frame.pack(side=tk.TOP, fill=tk.X, padx=15, pady=(10, 0))
+        self.compare_entry = ttk.Entry(compare_frame, width=50)
+        self.compare_db = ttk.Combobox(compare_frame, values=list(COLLECTIONS), state="readonly", width=12)
+        self.compare_db.current(0)
+        self.compare_button = ttk.Button(compare_frame, text="Спросить обе модели",
+                                         command=self.on_ask_both_clicked, style='TButton')
+        self.compare_result = ttk.Label(compare_frame, text="", font=('Arial', 9), foreground='#555555')
+        self.compare_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 10))
+        self.compare_db.pack(side=tk.LEFT, padx=(0, 10))
+        self.compare_button.pack(side=tk.LEFT)
+        self.compare_result.pack(side=tk.LEFT, padx=(10, 0))
+        self.compare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compare')
+
         # Создаем фреймы для моделей
         main_frame = ttk.Frame(self.root)
         main_frame.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
@@ -371,8 +641,9 @@ class LLMApplication:
         frst_llm = LLMWidget(
             main_frame,
             'TinyLlama',
-            self.lm,
-            client=self.chroma_client
+            'TinyLlama',
+            client=self.chroma_client,
+            local_indexes=self.local_indexes
         )
         frst_llm.pack(side=tk.LEFT, expand=True, fill=tk.BOTH, padx=10, pady=10)
 
@@ -381,13 +652,70 @@ class LLMApplication:
             main_frame,
             'GigaChat',
             'GigaChat',
-            client=self.chroma_client
+            client=self.chroma_client,
+            local_indexes=self.local_indexes
         )
         second_llm.pack(side=tk.RIGHT, expand=True, fill=tk.BOTH, padx=10, pady=10)
+        self.widgets = [frst_llm, second_llm]
+
+    def on_ask_both_clicked(self):
+        """Один поиск, затем обе модели отвечают одновременно, каждая в своей панели"""
+        question = self.compare_entry.get()
+        if not question.strip():
+            messagebox.showwarning("Предупреждение", "Введите вопрос перед отправкой")
+            return
+        busy = [widget.widget_name_label for widget in self.widgets if widget.busy]
+        if busy:
+            # Иначе новый запрос перезапишет событие отмены панели, и два ответа смешаются в одном окне
+            messagebox.showwarning("Предупреждение", f"Дождитесь ответа или отмените запрос: {', '.join(busy)}")
+            return
+        collection_name = COLLECTIONS[self.compare_db.get()]
+        start_time = time.time()
+        finished = {}
+
+        retrieval = self.compare_executor.submit(
+            retrieve_context, question, collection_name, self.chroma_client, self.local_indexes
+        )
+        retrieval.add_done_callback(lambda _: finished.setdefault('поиск', time.time() - start_time))
+        futures = []
+        for widget in self.widgets:
+            widget.question_entry.delete(0, tk.END)
+            widget.question_entry.insert(0, question)
+            future = widget.start_answer(question, collection_name, retrieval)
+            if future is None:
+                continue
+            future.add_done_callback(
+                lambda _, name=widget.widget_name_label: finished.setdefault(name, time.time() - start_time)
+            )
+            futures.append((widget.widget_name_label, future))
+        # Пока идет сравнение, панели не принимают собственных вопросов
+        for widget in self.widgets:
+            widget.set_locked(True)
+
+        self.compare_button.config(state='disabled')
+        self.compare_result.config(text="Поиск и генерация...")
+        self.root.after(50, self._poll_compare, start_time, retrieval, futures, finished)
+
+    def _poll_compare(self, start_time: float, retrieval: Future, futures: list[tuple[str, Future]],
+                      finished: dict):
+        # Время завершения записывают колбэки, они срабатывают чуть позже done()
+        if len(finished) < len(futures) + 1:
+            self.root.after(50, self._poll_compare, start_time, retrieval, futures, finished)
+            return
+        self.compare_button.config(state='normal')
+        for widget in self.widgets:
+            widget.set_locked(False)
+        parts = [f"поиск {finished['поиск']:.2f} сек" if retrieval.exception() is None else "поиск: ошибка"]
+        for name, future in futures:
+            parts.append(f"{name}: {finished[name]:.2f} сек" if future.exception() is None else f"{name}: ошибка")
+        parts.append(f"всего {time.time() - start_time:.2f} сек")
+        self.compare_result.config(text="  |  ".join(parts))
 
 
 if __name__ == "__main__":
-    app = LLMApplication()
+    # Отладочный вывод (промпты, результаты поиска) - LOG_LEVEL=DEBUG
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    app = LLMApplication(exit_when_ready="--startup-benchmark" in sys.argv)
 
 # if __name__ == "__main__":
 #     root = tk.Tk()
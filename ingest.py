@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from embedding_cache import EmbeddingCache
+from embedding_worker import TextEmbedder
+from fill_db_story import fill_db_bulk
+from pdf_to_txt import iter_pages
+from spliter import iter_articles, iter_lines, read_articles_jsonl
+
+
+class StageTimer:
+    def __init__(self, name: str):
+        """
+        Учет времени и количества элементов, прошедших через стадию конвейера
+        :param name: название стадии
+        """
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+
+    def wrap(self, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.busy += time.time() - start
+            self.first = self.first or start
+            self.last = time.time()
+            self.items += 1
+            yield item
+
+    def report(self) -> str:
+        wall = (self.last - self.first) if self.first else 0.0
+        rate = self.items / self.busy if self.busy > 0 else 0.0
+        return f'{self.name}: {self.items} шт., {self.busy:.2f} сек в стадии, {wall:.2f} сек от первого до последнего ' \
+               f'({rate:.1f} шт./сек)'
+
+
+def _in_background(iterable: Iterable, maxsize: int = 16) -> Iterator:
+    """Выполняет итератор в отдельном потоке; ограниченная очередь дает обратное давление."""
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+    errors = []
+
+    def worker():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while (item := items.get()) is not done:
+        yield item
+    if errors:
+        raise errors[0]
+
+
+def _tee_to_file(lines: Iterable[str], path: Path) -> Iterator[str]:
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+            yield line
+
+
+def _read_lines(path: Path) -> Iterator[str]:
+    # Файл закрывается, когда генератор исчерпан или закрыт
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from f
+
+
+def _tee_to_jsonl(records: Iterable[tuple[str, str]], path: Path) -> Iterator[tuple[str, str]]:
+    with open(path, 'w', encoding='utf-8') as f:
+        for article, text in records:
+            f.write(json.dumps({'article': article, 'text': text}, ensure_ascii=False) + '\n')
+            yield article, text
+
+
+def _file_fingerprint(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestCheckpoint:
+    def __init__(self, checkpoint_dir: str | Path, source_fingerprint: str, collection_name: str):
+        """
+        Контрольные точки конвейера загрузки. Если исходный PDF или коллекция изменились,
+        прежние контрольные точки сбрасываются
+        :param checkpoint_dir: каталог с контрольными точками
+        :param source_fingerprint: хэш исходного PDF
+        :param collection_name: название целевой коллекции
+        """
+        self.dir = Path(checkpoint_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.dir / 'state.json'
+        self.pages_cache = self.dir / 'pages'
+        self.text_path = self.dir / 'tk_rf.txt'
+        self.articles_path = self.dir / 'tk_rf.jsonl'
+        self.ingested_path = self.dir / 'ingested.txt'
+        self._lock = threading.Lock()
+
+        key = {'source': source_fingerprint, 'collection': collection_name}
+        self.state = json.loads(self.state_path.read_text(encoding='utf-8')) if self.state_path.exists() else {}
+        if self.state.get('key') != key:
+            self.state = {'key': key, 'done': []}
+            self.ingested_path.unlink(missing_ok=True)
+            self._save()
+
+    def _save(self) -> None:
+        tmp = self.state_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False, indent=4), encoding='utf-8')
+        tmp.replace(self.state_path)
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.state['done']
+
+    def mark_done(self, stage: str) -> None:
+        with self._lock:
+            if stage not in self.state['done']:
+                self.state['done'].append(stage)
+                self._save()
+
+    def check_collection(self, collection) -> None:
+        """
+        Сбрасывает отметки о загруженных статьях, если коллекцию пересоздали под тем же именем
+        или из нее пропали записи: иначе повторный запуск пропустил бы все статьи
+        :param collection: целевая коллекция
+        """
+        collection_id = str(collection.id)
+        ingested = self.ingested_ids()
+        if self.state.get('collection_id') == collection_id and collection.count() >= len(ingested):
+            return
+        if ingested:
+            print(f'Коллекция {collection.name} не содержит загруженных ранее статей, загружаем заново')
+        with self._lock:
+            self.ingested_path.unlink(missing_ok=True)
+            self.state['collection_id'] = collection_id
+            self.state['done'] = [stage for stage in self.state['done'] if stage != 'ingest']
+            self._save()
+
+    def ingested_ids(self) -> set[str]:
+        if not self.ingested_path.exists():
+            return set()
+        return set(self.ingested_path.read_text(encoding='utf-8').split('\n')) - {''}
+
+    def record_ingested(self, ids: list[str]) -> None:
+        with self._lock, open(self.ingested_path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(ids) + '\n')
+
+
+def ingest(input_pdf: str | Path,
+           collection,
+           embedding_model: TextEmbedder,
+           checkpoint_dir: str | Path = 'storage/checkpoints',
+           workers: int = 1,
+           chunk_size: int = 128) -> dict:
+    """
+    Полный конвейер PDF -> статьи -> эмбеддинги -> Chroma. Стадии работают одновременно,
+    каждая пишет контрольную точку, поэтому после сбоя загрузка продолжается с места остановки
+    :param input_pdf: путь к PDF с ТК РФ
+    :param collection: коллекция Chroma (или InMemoryCollection)
+    :param embedding_model: модель для получения эмбеддингов
+    :param checkpoint_dir: каталог для контрольных точек
+    :param workers: количество процессов для извлечения страниц
+    :param chunk_size: количество статей в одном пакете загрузки
+    :return: статистика по стадиям
+    """
+    input_pdf = Path(input_pdf)
+    checkpoint = IngestCheckpoint(checkpoint_dir, _file_fingerprint(input_pdf), collection.name)
+    checkpoint.check_collection(collection)
+    timers = {name: StageTimer(name) for name in ('extract', 'split', 'ingest')}
+    start = time.time()
+
+    if checkpoint.is_done('split'):
+        print(f'Статьи берутся из контрольной точки {checkpoint.articles_path}')
+        records = read_articles_jsonl(checkpoint.articles_path.resolve())
+    else:
+        if checkpoint.is_done('extract'):
+            print(f'Текст берется из контрольной точки {checkpoint.text_path}')
+            lines = _read_lines(checkpoint.text_path)
+        else:
+            pages = iter_pages(input_pdf.resolve(), workers=workers, cache_dir=checkpoint.pages_cache.resolve())
+            # Страницы разделяются пустой строкой, как в pdf_to_text: иначе заголовок статьи в начале
+            # страницы склеивается с концом предыдущей, а контрольная точка отличается от tk_rf.txt
+            pages = (page + '\n\n' for page in timers['extract'].wrap(pages))
+            lines = _tee_to_file(iter_lines(pages), checkpoint.text_path)
+            # Извлечение страниц идет в своем потоке параллельно с разбиением и кодированием
+            lines = _in_background(lines, maxsize=1024)
+        records = _tee_to_jsonl(timers['split'].wrap(iter_articles(lines)), checkpoint.articles_path)
+
+    def records_with_checkpoints():
+        ingested = checkpoint.ingested_ids()
+        if ingested:
+            print(f'Пропускаем {len(ingested)} уже загруженных статей')
+        for article, text in records:
+            if article not in ingested:
+                yield article, text
+        # Генератор исчерпан - значит, извлечение и разбиение завершены
+        checkpoint.mark_done('extract')
+        checkpoint.mark_done('split')
+
+    ingest_start = time.time()
+    stats = fill_db_bulk(records_with_checkpoints(),
+                         embedding_model=embedding_model,
+                         collection=collection,
+                         chunk_size=chunk_size,
+                         on_chunk_done=checkpoint.record_ingested)
+    timers['ingest'].items = stats['added']
+    timers['ingest'].busy = stats['upload_time'] + stats['embed_time']
+    timers['ingest'].first, timers['ingest'].last = ingest_start, time.time()
+    if not stats['failed_ids']:
+        checkpoint.mark_done('ingest')
+
+    print(f'Загрузка завершена за {time.time() - start:.2f} сек')
+    for timer in timers.values():
+        print(timer.report())
+    return {
+        'total_time': time.time() - start,
+        'stages': {name: {'items': timer.items, 'busy': timer.busy} for name, timer in timers.items()},
+        'failed_ids': stats['failed_ids']
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Загрузка ТК РФ из PDF в векторную базу')
+    parser.add_argument('pdf', help='путь к PDF')
+    parser.add_argument('--collection', default='tk_rf')
+    parser.add_argument('--checkpoint-dir', default='storage/checkpoints')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--persist-path', help='локальная Chroma (PersistentClient) вместо сервера')
+    parser.add_argument('--in-memory', action='store_true', help='коллекция в памяти процесса (без Chroma)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=128)
+    args = parser.parse_args()
+
+    if args.in_memory:
+        from memory_collection import InMemoryClient
+        client = InMemoryClient()
+    else:
+        import chromadb
+        from chroma_access import get_chroma
+        client = chromadb.PersistentClient(path=args.persist_path) if args.persist_path \
+            else get_chroma(args.host, args.port)
+
+    ingest(args.pdf,
+           collection=client.get_or_create_collection(args.collection),
+           embedding_model=TextEmbedder(cache=EmbeddingCache()),
+           checkpoint_dir=args.checkpoint_dir,
+           workers=args.workers,
+           chunk_size=args.chunk_size)
@@ -1,8 +1,123 @@
+import copy
+import hashlib
+import logging
+import threading
+import time
+
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import Optional
+from transformers import (AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList,
+                          TextIteratorStreamer)
+from transformers.generation.streamers import BaseStreamer
+from typing import Iterator, Optional
 import os
-from pprint import pprint
+
+from context_packer import ContextPacker, PackedContext
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class StopOnEvent(StoppingCriteria):
+    def __init__(self, event: threading.Event):
+        """
+        Прерывает генерацию, как только установлено событие (например, пользователь нажал "Отмена")
+        :param event: событие отмены
+        """
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+# Параметры загрузки по умолчанию:
+#   dtype - тип весов ("float32", "bfloat16", "float16"; float16 имеет смысл только на GPU)
+#   quantize - "int8" для динамической int8-квантизации линейных слоев на CPU
+#   low_cpu_mem_usage - загружать веса сразу в модель, без промежуточной копии в памяти
+#   use_safetensors - читать веса из safetensors через mmap
+#   save_local_copy - дополнительно сохранять модель в model_dir (удваивает запись на диск при первом запуске)
+DEFAULT_LOAD_OPTIONS = {
+    "dtype": "float32",
+    "quantize": None,
+    "low_cpu_mem_usage": True,
+    "use_safetensors": True,
+    "save_local_copy": False,
+}
+
+# Настройки загрузки для конкретных моделей (дополняют DEFAULT_LOAD_OPTIONS).
+# bfloat16 применяется, только если устройство его поддерживает (см. _bf16_supported), иначе float32
+MODEL_LOAD_OPTIONS = {
+    "TinyLlama/TinyLlama-1.1B-Chat-v1.0": {"dtype": "bfloat16"},
+}
+
+# Режимы для сравнения в benchmark_load_modes
+LOAD_MODES = {
+    "fp32": {"dtype": "float32"},
+    "bf16": {"dtype": "bfloat16"},
+    "int8": {"dtype": "float32", "quantize": "int8"},
+}
+
+
+def _bf16_supported(device: str) -> bool:
+    """Есть ли на устройстве аппаратная поддержка bfloat16 (иначе вычисления в bf16 эмулируются и медленнее fp32)"""
+    if device.startswith("cuda"):
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    if device != "cpu":
+        return False
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        # Старые сборки torch: смотрим флаги процессора
+        try:
+            with open("/proc/cpuinfo", encoding="utf-8") as f:
+                flags = f.read()
+        except OSError:
+            return False
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+class _TokenTimer(BaseStreamer):
+    def __init__(self):
+        """
+        Отмечает момент появления первого нового токена, чтобы разделить время generate на prefill и decode.
+        Первый вызов put от generate - токены промпта
+        """
+        self.prompt_seen = False
+        self.first_token_at: Optional[float] = None
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+        elif self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+class _TimedTextStreamer(TextIteratorStreamer):
+    def __init__(self, tokenizer, **kwargs):
+        """TextIteratorStreamer, который дополнительно замеряет первый токен и суммарное время детокенизации"""
+        super().__init__(tokenizer, **kwargs)
+        self.first_token_at: Optional[float] = None
+        self.detokenize_time = 0.0
+
+    def put(self, value):
+        if self.skip_prompt and self.next_tokens_are_prompt:
+            return super().put(value)
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        start = time.perf_counter()
+        super().put(value)
+        self.detokenize_time += time.perf_counter() - start
+
+
+def _record_generation(started: float, first_token_at: Optional[float], prompt_tokens: int) -> None:
+    finished = time.perf_counter()
+    if first_token_at is None:
+        tracer.record("prefill", finished - started, tokens=prompt_tokens)
+        return
+    tracer.record("prefill", first_token_at - started, tokens=prompt_tokens)
+    tracer.record("decode", finished - first_token_at)
 
 
 class LanguageModel:
@@ -11,6 +126,9 @@ class LanguageModel:
             model_name: str,
             model_dir: str = "models",
             device: Optional[str] = None,
+            use_prefix_cache: bool = True,
+            load_options: Optional[dict] = None,
+            context_tokens: int = 768,
     ):
         """
         Инициализация языковой модели.
@@ -18,10 +136,29 @@ class LanguageModel:
         :param model_name: Название модели (например, "gpt2", "EleutherAI/gpt-neo-1.3B")
         :param model_dir: Директория для хранения моделей (по умолчанию "models" в корне проекта)
         :param device: Устройство для работы модели (если None, автоматически выбирает GPU или CPU)
+        :param use_prefix_cache: Переиспользовать KV-кэш постоянного начала промпта между запросами
+        :param load_options: Параметры загрузки (см. DEFAULT_LOAD_OPTIONS), дополняют MODEL_LOAD_OPTIONS
+        :param context_tokens: Бюджет токенов на найденный контекст в промпте
         """
         self.model_name = model_name
         self.model_dir = model_dir
         self.device = self._get_device(device)
+        self.load_options = {
+            **DEFAULT_LOAD_OPTIONS,
+            **MODEL_LOAD_OPTIONS.get(model_name, {}),
+            **(load_options or {})
+        }
+        self.use_prefix_cache = use_prefix_cache
+
+        # Системная часть промпта ask (постоянное начало, для которого кэшируется prefill)
+        self.ask_system_prompt = """You are a Russian-speaking assistant for working with documents. Rules:
+1. Answer ONLY in Russian
+2. I forbid you to answer in English, Chinese, Korean and Chinese"""
+        self._prefix_lock = threading.Lock()
+        self._prefix_state = None
+        self._tokenizer_lock = threading.Lock()
+        # Число токенов шаблона промпта без вопроса и документа (считается один раз)
+        self._template_tokens: Optional[int] = None
 
         self.system_prompt = """
 
@@ -39,6 +176,16 @@ class LanguageModel:
 
         # Загружаем модель и токенизатор
         self.model, self.tokenizer = self._load_model_and_tokenizer()
+        # Отдельный токенизатор для ask_batch: паддинг слева настраивается один раз,
+        # а не на общем токенизаторе, которым одновременно пользуются другие потоки
+        self.batch_tokenizer = copy.deepcopy(self.tokenizer)
+        self.batch_tokenizer.padding_side = "left"
+        if self.batch_tokenizer.pad_token is None:
+            self.batch_tokenizer.pad_token = self.batch_tokenizer.eos_token
+
+        # Контекст упаковывается в бюджет токенов, чтобы длина промпта и время prefill были предсказуемы
+        self.max_context_length = getattr(self.model.config, "max_position_embeddings", 2048)
+        self.context_packer = ContextPacker(self.count_tokens, context_tokens)
 
     def _get_device(self, device: Optional[str]) -> str:
         """
@@ -53,88 +200,452 @@ class LanguageModel:
 
     def _load_model_and_tokenizer(self):
         """
-        Загружает модель и токенизатор, сохраняя их в указанной директории.
+        Загружает модель и токенизатор согласно self.load_options.
 
         :return: Кортеж (модель, токенизатор)
         """
+        options = self.load_options
         model_path = os.path.join(self.model_dir, self.model_name.replace("/", "_"))
+        dtype = getattr(torch, options["dtype"])
+        if dtype == torch.float16 and self.device == "cpu":
+            print("float16 на CPU не поддерживается полноценно, используем bfloat16")
+            dtype = torch.bfloat16
+        if dtype == torch.bfloat16 and not _bf16_supported(self.device):
+            print(f"bfloat16 на {self.device} не поддерживается аппаратно, используем float32")
+            dtype = torch.float32
+
+        # Если модель уже загружена, используем локальную версию, иначе - кэш Hugging Face
+        source = model_path if os.path.exists(model_path) else self.model_name
+        print(f"Загружаем модель {source} ({options})")
+        tokenizer = AutoTokenizer.from_pretrained(source)
+        model = AutoModelForCausalLM.from_pretrained(
+            source,
+            torch_dtype=dtype,
+            low_cpu_mem_usage=options["low_cpu_mem_usage"],
+            use_safetensors=options["use_safetensors"] or None,
+        )
 
-        # Если модель уже загружена, используем локальную версию
-        if os.path.exists(model_path):
-            print(f"Загружаем модель из локального кэша: {model_path}")
-            tokenizer = AutoTokenizer.from_pretrained(model_path)
-            model = AutoModelForCausalLM.from_pretrained(model_path)
-        else:
-            print(f"Загружаем модель {self.model_name} и сохраняем в {model_path}")
-            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            model = AutoModelForCausalLM.from_pretrained(self.model_name)
-
-            # Сохраняем модель для будущего использования
+        if options["save_local_copy"] and source != model_path:
             tokenizer.save_pretrained(model_path)
             model.save_pretrained(model_path)
 
         # Перемещаем модель на выбранное устройство
         model = model.to(self.device)
+        if options["quantize"] == "int8":
+            if self.device != "cpu":
+                raise ValueError("Динамическая int8-квантизация поддерживается только на CPU")
+            model = torch.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
         return model, tokenizer
 
+    def tokenize(self, text: str, **kwargs):
+        """
+        Кодирует текст общим токенизатором. Быстрый токенизатор нельзя вызывать из нескольких потоков
+        одновременно (ошибка "Already borrowed"), а токены считают и GUI, и сервис, и генерация
+
+        :param text: Текст
+        :return: Результат вызова токенизатора
+        """
+        with self._tokenizer_lock:
+            return self.tokenizer(text, **kwargs)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenize(text, add_special_tokens=False)["input_ids"])
+
+    def _prompt_overhead(self, question: str) -> int:
+        """Токены промпта без документа: шаблон токенизируется один раз, для запроса - только вопрос"""
+        if self._template_tokens is None:
+            self._template_tokens = len(self.tokenize(self.build_prompt("", ""))["input_ids"])
+        return self._template_tokens + self.count_tokens(question)
+
+    def _budget_after(self, overhead: int, max_length: int) -> int:
+        return max(0, min(self.context_packer.max_tokens, self.max_context_length - overhead - max_length))
+
+    def context_budget(self, question: str, max_length: int = 100) -> int:
+        """
+        Сколько токенов можно отдать под контекст: не больше context_tokens
+        и не больше, чем остается в окне модели после вопроса, шаблона и ответа
+
+        :param question: Вопрос пользователя
+        :param max_length: Максимальное количество новых токенов
+        :return: Бюджет токенов на контекст
+        """
+        return self._budget_after(self._prompt_overhead(question), max_length)
+
+    def pack_context(self, question: str, passages: list[tuple[str, float]], max_length: int = 100) -> PackedContext:
+        """
+        Собирает найденные фрагменты в контекст в пределах бюджета токенов
+
+        :param question: Вопрос пользователя
+        :param passages: Пары (текст, расстояние), см. get_passages_by_embedding
+        :param max_length: Максимальное количество новых токенов
+        :return: Контекст и количество токенов в итоговом промпте
+        """
+        with tracer.span("prompt_build") as span:
+            overhead = self._prompt_overhead(question)
+            packed = self.context_packer.pack(passages, self._budget_after(overhead, max_length))
+            # Промпт целиком не токенизируется: размер складывается из уже посчитанных частей
+            packed.prompt_tokens = overhead + packed.tokens
+            span["prompt_tokens"] = packed.prompt_tokens
+        logger.debug("Контекст: %d фрагм., %d ток., промпт %d ток.%s", packed.passages, packed.tokens,
+                     packed.prompt_tokens, " (обрезан)" if packed.truncated else "")
+        return packed
+
+    def fit_document(self, question: str, document: str, max_length: int = 100) -> str:
+        """
+        Обрезает готовый документ по границе предложения, если он не влезает в бюджет контекста
+
+        :param question: Вопрос пользователя
+        :param document: Контекст
+        :param max_length: Максимальное количество новых токенов
+        :return: Контекст в пределах бюджета
+        """
+        return self.context_packer.trim(document, self.context_budget(question, max_length))
+
+    def _encode_prompt(self, question: str, document: str, max_length: int):
+        """
+        Строит и токенизирует промпт. Обычно документ уже упакован pack_context и влезает в бюджет,
+        поэтому промпт токенизируется один раз; документ обрезается и промпт кодируется заново,
+        только если бюджет превышен
+
+        :param question: Вопрос пользователя
+        :param document: Найденный в базе контекст
+        :param max_length: Максимальное количество новых токенов
+        :return: Результат токенизатора на устройстве модели
+        """
+        with tracer.span("prompt_build"):
+            overhead = self._prompt_overhead(question)
+            budget = self._budget_after(overhead, max_length)
+            prompt = self.build_prompt(question, document)
+        with tracer.span("tokenize"):
+            inputs = self.tokenize(prompt, return_tensors="pt")
+        if inputs["input_ids"].shape[1] > overhead + budget:
+            with tracer.span("prompt_build"):
+                prompt = self.build_prompt(question, self.context_packer.trim(document, budget))
+            with tracer.span("tokenize"):
+                inputs = self.tokenize(prompt, return_tensors="pt")
+        logger.debug("Промпт: %s", prompt)
+        return inputs.to(self.device)
+
     def build_chat_prompt(self, document: str, question: str) -> str:
         return f"""
         {self.system_prompt}
 
-        Документ: {document[:3000]}
+        Документ: {self.fit_document(question, document)}
         Вопрос: {question}
         </s>
 
         """
 
+    def build_prompt(self, question: str, document: str) -> str:
+        """
+        Строит промпт в формате TinyLlama-Chat
+
+        :param question: Вопрос пользователя
+        :param document: Найденный в базе контекст
+        :return: Промпт для генерации
+        """
+        return self.build_prompt_prefix() + f"""I only know, that: {document}
+Question: {question}
+give me answer based on mine knowledge in Russian</s>
+<|assistant|>"""
+
+    def build_prompt_prefix(self) -> str:
+        """
+        Постоянное начало промпта, не зависящее от вопроса и документа
+
+        :return: Префикс промпта
+        """
+        return f"""<|system|>
+{self.ask_system_prompt}</s>
+<|user|>
+"""
+
+    def _prefix_cache(self):
+        """
+        KV-кэш префикса промпта. Пересчитывается автоматически, если изменились
+        модель, ask_system_prompt или шаблон префикса
+
+        :return: Кортеж (токены префикса, past_key_values)
+        """
+        prefix = self.build_prompt_prefix()
+        key = hashlib.sha256(f"{self.model_name}\0{prefix}".encode("utf-8")).hexdigest()
+        with self._prefix_lock:
+            if self._prefix_state is None or self._prefix_state[0] != key:
+                prefix_ids = self.tokenize(prefix, return_tensors="pt")["input_ids"].to(self.device)
+                with torch.no_grad():
+                    past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+                self._prefix_state = (key, prefix_ids, past_key_values)
+            return self._prefix_state[1], self._prefix_state[2]
+
+    def _prefix_cache_kwargs(self, input_ids: torch.Tensor) -> dict:
+        """
+        Аргументы generate для продолжения с закэшированного префикса.
+        Кэш используется, только если токенизация промпта начинается ровно с токенов префикса
+
+        :param input_ids: Токены полного промпта (батч из одного элемента)
+        :return: {"past_key_values": ...} или пустой словарь
+        """
+        if not self.use_prefix_cache or input_ids.shape[0] != 1:
+            return {}
+        prefix_ids, past_key_values = self._prefix_cache()
+        length = prefix_ids.shape[1]
+        if input_ids.shape[1] <= length or not torch.equal(input_ids[0, :length], prefix_ids[0]):
+            return {}
+        # generate дописывает кэш, поэтому каждому запросу нужна своя копия
+        return {"past_key_values": copy.deepcopy(past_key_values)}
+
+    def measure_prefix_savings(self, question: str, document: str, repeats: int = 3) -> dict:
+        """
+        Измеряет время prefill полного промпта и prefill только его переменной части поверх кэша префикса
+
+        :param question: Вопрос пользователя
+        :param document: Контекст
+        :param repeats: Количество повторов (берется минимум)
+        :return: Время обоих вариантов и экономия в миллисекундах на запрос
+        """
+        input_ids = self.tokenize(self.build_prompt(question, document), return_tensors="pt")["input_ids"].to(self.device)
+        prefix_ids, _ = self._prefix_cache()
+        length = prefix_ids.shape[1]
+
+        def best_of(func) -> float:
+            timings = []
+            for _ in range(repeats):
+                start = time.time()
+                with torch.no_grad():
+                    func()
+                timings.append(time.time() - start)
+            return min(timings) * 1000
+
+        full_ms = best_of(lambda: self.model(input_ids, use_cache=True))
+        cached_ms = best_of(lambda: self.model(
+            input_ids[:, length:],
+            past_key_values=self._prefix_cache_kwargs(input_ids)["past_key_values"],
+            use_cache=True
+        ))
+        report = {
+            "prompt_tokens": input_ids.shape[1],
+            "prefix_tokens": length,
+            "full_prefill_ms": full_ms,
+            "cached_prefill_ms": cached_ms,
+            "saved_ms": full_ms - cached_ms
+        }
+        print(f"Prefill: {report}")
+        return report
+
+    def _generation_kwargs(
+            self,
+            temperature: float,
+            max_length: int,
+            stop_event: Optional[threading.Event],
+            **kwargs
+    ) -> dict:
+        if stop_event is not None:
+            kwargs['stopping_criteria'] = StoppingCriteriaList([StopOnEvent(stop_event)])
+        # Переданные явно параметры (например, do_sample=False для замеров) заменяют значения по умолчанию
+        return {
+            **dict(
+                temperature=temperature,
+                max_new_tokens=max_length,
+                do_sample=True,
+                top_p=0.9,
+                repetition_penalty=1.1,
+                no_repeat_ngram_size=3,
+                eos_token_id=self.tokenizer.eos_token_id,
+                pad_token_id=self.tokenizer.eos_token_id
+            ),
+            **kwargs
+        }
+
     def ask(
             self,
             question: str,
             document: str,
             temperature: float = 0.7,
             max_length: int = 100,
+            stop_event: Optional[threading.Event] = None,
             **kwargs
     ) -> str:
-        # Строим промпт в формате TinyLlama-Chat
-        prompt = f"""<|system|>
-You are a Russian-speaking assistant for working with documents. Rules:
-1. Answer ONLY in Russian
-2. I forbid you to answer in English, Chinese, Korean and Chinese</s>
-<|user|>
-I only know, that: {document}
-Question: {question}
-give me answer based on mine knowledge in Russian</s>
-<|assistant|>"""
-        pprint(prompt)
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        inputs = self._encode_prompt(question, document, max_length)
 
         # Генерируем ответ
+        timer = _TokenTimer()
+        started = time.perf_counter()
         with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
-                temperature=temperature,
-                max_new_tokens=max_length,
-                do_sample=True,
-                top_p=0.9,
-                repetition_penalty=1.1,
-                no_repeat_ngram_size=3,
-                eos_token_id=self.tokenizer.eos_token_id,
-                pad_token_id=self.tokenizer.eos_token_id,
-                **kwargs
+                streamer=timer,
+                **self._prefix_cache_kwargs(inputs["input_ids"]),
+                **self._generation_kwargs(temperature, max_length, stop_event, **kwargs)
             )
+        _record_generation(started, timer.first_token_at, inputs["input_ids"].shape[1])
 
-        pprint(outputs)
-        # Декодируем ответ
-        answer = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        pprint(answer)
-        # Удаляем промпт из ответа
-        answer = answer[len(prompt):].strip()
+        # Декодируем только новые токены, промпт повторно не декодируется
+        with tracer.span("detokenize"):
+            answer = self.tokenizer.decode(outputs[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        logger.debug("Ответ: %s", answer)
 
-        return answer
+        return answer.strip()
+
+    def ask_batch(
+            self,
+            requests: list[tuple[str, str]],
+            temperature: float = 0.7,
+            max_length: int = 100,
+            return_token_counts: bool = False,
+            **kwargs
+    ):
+        """
+        Генерирует ответы на несколько вопросов одним вызовом generate
+
+        :param requests: Пары (вопрос, документ)
+        :param temperature: Температура сэмплирования (общая для батча)
+        :param max_length: Максимальное количество новых токенов (общее для батча)
+        :param return_token_counts: Вернуть также количество сгенерированных токенов по каждому ответу
+        :return: Список ответов (или пар ответ, число токенов) в порядке запросов
+        """
+        prompts = [
+            self.build_prompt(question, self.fit_document(question, document, max_length))
+            for question, document in requests
+        ]
+        # Для генерации паддинг должен быть слева, чтобы все промпты заканчивались в одной позиции
+        with tracer.span("tokenize", batch_size=len(prompts)):
+            inputs = self.batch_tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+
+        timer = _TokenTimer()
+        started = time.perf_counter()
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                streamer=timer,
+                **self._generation_kwargs(temperature, max_length, None, **kwargs)
+            )
+        _record_generation(started, timer.first_token_at, inputs["input_ids"].numel())
+
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        with tracer.span("detokenize", batch_size=len(prompts)):
+            answers = [
+                answer.strip()
+                for answer in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            ]
+        if not return_token_counts:
+            return answers
+        # Токены после eos (добивка до самой длинной строки батча) не считаются
+        counts = []
+        for row in new_tokens.tolist():
+            eos = row.index(self.tokenizer.eos_token_id) + 1 if self.tokenizer.eos_token_id in row else len(row)
+            counts.append(eos)
+        return list(zip(answers, counts))
+
+    def ask_stream(
+            self,
+            question: str,
+            document: str,
+            temperature: float = 0.7,
+            max_length: int = 100,
+            stop_event: Optional[threading.Event] = None,
+            **kwargs
+    ) -> Iterator[str]:
+        """
+        Потоковый вариант ask: отдает текст ответа по мере генерации
+
+        :param question: Вопрос пользователя
+        :param document: Найденный в базе контекст
+        :param temperature: Температура сэмплирования
+        :param max_length: Максимальное количество новых токенов
+        :param stop_event: Событие отмены генерации
+        :return: Итератор фрагментов ответа
+        """
+        inputs = self._encode_prompt(question, document, max_length)
+        # skip_prompt: стример декодирует только сгенерированные токены
+        streamer = _TimedTextStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        errors = []
+
+        def generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        **self._prefix_cache_kwargs(inputs["input_ids"]),
+                        **self._generation_kwargs(temperature, max_length, stop_event, **kwargs)
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Завершаем стример, иначе читающий поток будет ждать вечно
+                streamer.end()
+
+        started = time.perf_counter()
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+            thread.join()
+        finally:
+            _record_generation(started, streamer.first_token_at, inputs["input_ids"].shape[1])
+            tracer.record("detokenize", streamer.detokenize_time)
+        if errors:
+            raise errors[0]
+
+
+def _benchmark_load_mode(model_name: str, options: dict, results) -> None:
+    from model_registry import _rss_bytes
+
+    rss_before = _rss_bytes()
+    start = time.time()
+    lm = LanguageModel(model_name, load_options=options, use_prefix_cache=False)
+    load_time = time.time() - start
+    rss = _rss_bytes() - rss_before if rss_before else None
+
+    inputs = lm.tokenizer(lm.build_prompt("Сколько дней длится отпуск?", "Отпуск длится 28 дней."),
+                          return_tensors="pt").to(lm.device)
+    start = time.time()
+    with torch.no_grad():
+        outputs = lm.model.generate(**inputs, max_new_tokens=32, min_new_tokens=32, do_sample=False,
+                                    pad_token_id=lm.tokenizer.eos_token_id)
+    generated = outputs.shape[1] - inputs["input_ids"].shape[1]
+    results.put({
+        "load_time": load_time,
+        "rss_mb": rss / 2 ** 20 if rss is not None else None,
+        "tokens_per_sec": generated / (time.time() - start)
+    })
+
+
+def benchmark_load_modes(model_name: str, modes: Optional[dict] = None) -> dict:
+    """
+    Сравнивает режимы загрузки модели: время загрузки, резидентная память и скорость генерации.
+    Каждый режим замеряется в отдельном процессе, чтобы память не смешивалась
+
+    :param model_name: Название модели
+    :param modes: Режимы {название: load_options} (по умолчанию LOAD_MODES)
+    :return: Результаты по режимам
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    report = {}
+    for mode, options in (modes or LOAD_MODES).items():
+        results = context.Queue()
+        process = context.Process(target=_benchmark_load_mode, args=(model_name, options, results))
+        process.start()
+        process.join()
+        report[mode] = results.get() if process.exitcode == 0 else {"error": process.exitcode}
+        print(f"{mode}: {report[mode]}")
+    return report
 
 
 # Пример использования
 if __name__ == "__main__":
+    import sys
+
+    if "--benchmark-load" in sys.argv:
+        # Время загрузки, память и скорость генерации для fp32 / bf16 / int8
+        benchmark_load_modes("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+        sys.exit(0)
+
     # Инициализация модели (скачается при первом запуске)
     lm = LanguageModel("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
 
@@ -167,3 +678,9 @@ if __name__ == "__main__":
     )
 
     print('Ответ модели:\t', response, '\n')
+
+    # Экономия prefill за счет кэша системного префикса
+    lm.measure_prefix_savings(
+        question="Какой мой любимый цвет?",
+        document="Мой любимый цвет зеленый"
+    )
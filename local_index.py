@@ -0,0 +1,165 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from fill_db_story import data_version
+from query_cache import query_cache
+
+
+class LocalVectorIndex:
+    def __init__(self, collection, page_size: int = 1000, hnsw_threshold: int = 50_000):
+        """
+        Зеркало коллекции Chroma в памяти процесса. Отвечает на query() в том же формате,
+        что и Chroma, поэтому подходит для get_sentences_by_embedding и
+        get_full_info_sentence_embeddings вместо коллекции
+        :param collection: исходная коллекция Chroma
+        :param page_size: размер страницы при чтении коллекции
+        :param hnsw_threshold: начиная с этого размера строится индекс HNSW (hnswlib), иначе точный перебор
+        """
+        self.collection = collection
+        self.name = collection.name
+        self.page_size = page_size
+        self.hnsw_threshold = hnsw_threshold
+        self.space = (collection.metadata or {}).get('hnsw:space', 'l2')
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _read_collection(self) -> tuple[list[str], np.ndarray, list[dict]]:
+        ids, vectors, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = self.collection.get(include=['embeddings', 'metadatas'], limit=self.page_size, offset=offset)
+            if not page['ids']:
+                break
+            ids.extend(page['ids'])
+            vectors.extend(page['embeddings'])
+            metadatas.extend(page['metadatas'])
+            offset += len(page['ids'])
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        return ids, matrix, metadatas
+
+    def refresh(self) -> None:
+        """Перечитывает коллекцию из Chroma и атомарно подменяет снимок"""
+        start = time.time()
+        ids, matrix, metadatas = self._read_collection()
+
+        hnsw = None
+        if len(ids) >= self.hnsw_threshold:
+            try:
+                import hnswlib
+                hnsw = hnswlib.Index(space=self.space, dim=matrix.shape[1])
+                hnsw.init_index(max_elements=len(ids), ef_construction=200, M=16)
+                hnsw.add_items(matrix, np.arange(len(ids)))
+                hnsw.set_ef(64)
+            except ImportError:
+                hnsw = None
+
+        if self.space == 'cosine':
+            prepared = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        else:
+            prepared = matrix
+        squared_norms = (matrix ** 2).sum(axis=1)
+
+        with self._lock:
+            self.ids, self.metadatas = ids, metadatas
+            self._matrix, self._squared_norms, self._hnsw = prepared, squared_norms, hnsw
+            self.id = self.collection.id
+            self.data_version = data_version(self.collection)
+        # Закэшированные результаты поиска относятся к прежнему снимку
+        query_cache.invalidate(self.name)
+        print(f'Снимок коллекции {self.name}: {len(ids)} записей за {time.time() - start:.2f} сек')
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _distances(self, queries: np.ndarray, matrix: np.ndarray, squared_norms: np.ndarray) -> np.ndarray:
+        if self.space == 'cosine':
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            return 1.0 - queries @ matrix.T
+        if self.space == 'ip':
+            return 1.0 - queries @ matrix.T
+        # Как и в Chroma, l2 - квадрат евклидова расстояния
+        return (queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ matrix.T + squared_norms
+
+    def query(self, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(1, -1) if queries.ndim == 1 else queries
+        with self._lock:
+            ids, metadatas = self.ids, self.metadatas
+            matrix, squared_norms, hnsw = self._matrix, self._squared_norms, self._hnsw
+
+        result = {'ids': [], 'distances': [], 'metadatas': [], 'embeddings': None, 'documents': None}
+        n_results = min(n_results, len(ids))
+        if n_results == 0:
+            return {**result, 'ids': [[] for _ in queries], 'distances': [[] for _ in queries],
+                    'metadatas': [[] for _ in queries]}
+
+        if hnsw is not None:
+            labels, distances = hnsw.knn_query(queries, k=n_results)
+            rows = zip(labels, distances)
+        else:
+            all_distances = self._distances(queries, matrix, squared_norms)
+            rows = []
+            for row in all_distances:
+                top = np.argpartition(row, n_results - 1)[:n_results]
+                top = top[np.argsort(row[top])]
+                rows.append((top, row[top]))
+
+        for labels, distances in rows:
+            result['ids'].append([ids[i] for i in labels])
+            result['distances'].append([float(d) for d in distances])
+            result['metadatas'].append([metadatas[i] for i in labels])
+        return result
+
+
+class LocalIndexRegistry:
+    def __init__(self, client, check_interval: float = 30.0):
+        """
+        Лениво создаваемые локальные зеркала коллекций; сервер Chroma нужен только для снимков и записи.
+        Коллекцию обычно перезаливают другим процессом (ingest.py, fill_db_story.py), поэтому не чаще
+        раза в check_interval секунд get() сверяет id, число записей и метку версии данных коллекции
+        (ее меняют fill_db_bulk и sync_from_json) со снимком и перечитывает коллекцию.
+        После правки коллекции в обход fill_db_story нужен refresh()
+        :param client: клиент Chroma
+        :param check_interval: как часто сверять снимок с коллекцией (сек)
+        """
+        self.client = client
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._indexes: dict[str, LocalVectorIndex] = {}
+        self._checked: dict[str, float] = {}
+
+    def get(self, name: str) -> LocalVectorIndex:
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = LocalVectorIndex(self.client.get_collection(name))
+                self._checked[name] = time.time()
+                return self._indexes[name]
+            index = self._indexes[name]
+            if time.time() - self._checked[name] < self.check_interval:
+                return index
+            self._checked[name] = time.time()
+
+        # Закэшированный в ChromaAccess дескриптор мог пережить пересоздание коллекции
+        invalidate = getattr(self.client, 'invalidate', None)
+        if invalidate is not None:
+            invalidate(name)
+        collection = self.client.get_collection(name)
+        if collection.id != index.id or data_version(collection) != index.data_version \
+                or collection.count() != index.count():
+            # Коллекцию пересоздали, дозагрузили или синхронизировали - снимок устарел
+            index.collection = collection
+            index.refresh()
+        return index
+
+    def refresh(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            indexes = [self._indexes[name]] if name in self._indexes else \
+                list(self._indexes.values()) if name is None else []
+        for index in indexes:
+            index.collection = self.client.get_collection(index.name)
+            index.refresh()
+            with self._lock:
+                self._checked[index.name] = time.time()
@@ -0,0 +1,139 @@
+import threading
+import uuid
+from typing import Optional
+
+import numpy as np
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, (str, dict)):
+        return [value]
+    return list(value)
+
+
+def _as_matrix(embeddings) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    return matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+
+
+class InMemoryCollection:
+    # Данные живут только в этом процессе: сохраненные на диске ответы к ней не относятся
+    in_memory = True
+
+    def __init__(self, name: str, metadata: Optional[dict] = None):
+        """
+        Коллекция в памяти процесса с тем же интерфейсом, что и chromadb.Collection,
+        в объеме, который используется в проекте. Нужна для офлайн-прогонов и бенчмарков
+        :param name: название коллекции
+        :param metadata: метаданные коллекции (учитывается 'hnsw:space': l2, cosine или ip)
+        """
+        self.name = name
+        self.id = uuid.uuid4()
+        self.metadata = metadata or {}
+        self._lock = threading.Lock()
+        self._records: dict[str, tuple[np.ndarray, dict]] = {}
+
+    def count(self) -> int:
+        return len(self._records)
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[dict] = None, **kwargs) -> None:
+        if name is not None:
+            self.name = name
+        if metadata is not None:
+            # Как и в Chroma, метрика задается только при создании коллекции
+            space = self.metadata.get('hnsw:space')
+            self.metadata = dict(metadata) if space is None else {**metadata, 'hnsw:space': space}
+
+    def add(self, ids, embeddings, metadatas=None, **kwargs) -> None:
+        ids = _as_list(ids)
+        with self._lock:
+            duplicates = [key for key in ids if key in self._records]
+            if duplicates:
+                raise ValueError(f'Записи уже существуют: {duplicates}')
+        self.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, metadatas=None, **kwargs) -> None:
+        ids = _as_list(ids)
+        matrix = _as_matrix(embeddings)
+        metadatas = _as_list(metadatas) or [{} for _ in ids]
+        with self._lock:
+            for key, vector, metadata in zip(ids, matrix, metadatas):
+                self._records[key] = (vector.copy(), dict(metadata))
+
+    def delete(self, ids=None, **kwargs) -> None:
+        with self._lock:
+            for key in _as_list(ids):
+                self._records.pop(key, None)
+
+    def get(self, ids=None, include=('metadatas',), limit: Optional[int] = None, offset: Optional[int] = None,
+            **kwargs) -> dict:
+        with self._lock:
+            keys = [key for key in _as_list(ids) if key in self._records] if ids is not None \
+                else list(self._records)
+            keys = keys[offset or 0:][:limit]
+            return {
+                'ids': keys,
+                'embeddings': [self._records[key][0] for key in keys] if 'embeddings' in include else None,
+                'metadatas': [self._records[key][1] for key in keys] if 'metadatas' in include else None,
+                'documents': None
+            }
+
+    def query(self, query_embeddings, n_results: int = 10, include=('metadatas', 'distances'), **kwargs) -> dict:
+        queries = _as_matrix(query_embeddings)
+        with self._lock:
+            keys = list(self._records)
+            matrix = np.stack([self._records[key][0] for key in keys]) if keys \
+                else np.empty((0, queries.shape[1]), dtype=np.float32)
+            metadatas = [self._records[key][1] for key in keys]
+
+        space = self.metadata.get('hnsw:space', 'l2')
+        if space == 'cosine':
+            norm = lambda m: m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+            distances = 1.0 - norm(queries) @ norm(matrix).T
+        elif space == 'ip':
+            distances = 1.0 - queries @ matrix.T
+        else:
+            # Как и в Chroma, l2 - квадрат евклидова расстояния
+            distances = (queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ matrix.T \
+                + (matrix ** 2).sum(axis=1)
+
+        result = {'ids': [], 'distances': [], 'metadatas': [], 'embeddings': None, 'documents': None}
+        for row in distances:
+            top = np.argsort(row)[:n_results]
+            result['ids'].append([keys[i] for i in top])
+            result['distances'].append([float(row[i]) for i in top])
+            result['metadatas'].append([metadatas[i] for i in top])
+        return result
+
+
+class InMemoryClient:
+    def __init__(self):
+        """Минимальная замена chromadb.HttpClient для коллекций в памяти процесса"""
+        self._collections: dict[str, InMemoryCollection] = {}
+
+    def heartbeat(self) -> int:
+        return 0
+
+    def list_collections(self) -> list[InMemoryCollection]:
+        return list(self._collections.values())
+
+    def create_collection(self, name: str, metadata: Optional[dict] = None, **kwargs) -> InMemoryCollection:
+        if name in self._collections:
+            raise ValueError(f'Коллекция {name} уже существует')
+        self._collections[name] = InMemoryCollection(name, metadata)
+        return self._collections[name]
+
+    def get_collection(self, name: str, **kwargs) -> InMemoryCollection:
+        if name not in self._collections:
+            raise ValueError(f'Коллекция {name} не существует')
+        return self._collections[name]
+
+    def get_or_create_collection(self, name: str, metadata: Optional[dict] = None, **kwargs) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name, metadata)
+        return self._collections[name]
+
+    def delete_collection(self, name: str) -> None:
+        self._collections.pop(name, None)
@@ -0,0 +1,163 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+
+def _rss_bytes() -> int:
+    """Текущий резидентный объем памяти процесса; 0 - объем узнать нельзя (Windows без psutil)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        # /proc и os.sysconf есть только в Linux; замер памяти необязателен для загрузки моделей
+        return 0
+
+
+def _weights_bytes(instance: Any) -> int:
+    """Объем весов torch-модели внутри объекта (TextEmbedder.model, LanguageModel.model)"""
+    model = getattr(instance, 'model', instance)
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters()) + \
+            sum(b.numel() * b.element_size() for b in model.buffers())
+    except AttributeError:
+        return 0
+
+
+class _Entry:
+    def __init__(self, factory: Callable[[], Any], idle_timeout: Optional[float]):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.instance = None
+        self.lock = threading.Lock()
+        self.active = 0
+        self.last_used = 0.0
+        self.load_time = 0.0
+        self.rss_delta = 0
+        self.weights = 0
+
+
+class ModelRegistry:
+    def __init__(self, janitor_interval: float = 30.0):
+        """
+        Общий для процесса реестр моделей: модель загружается при первом обращении,
+        один экземпляр используется всеми потребителями, неиспользуемые модели выгружаются
+        :param janitor_interval: как часто проверять простаивающие модели (сек)
+        """
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._janitor_interval = janitor_interval
+        self._janitor: Optional[threading.Thread] = None
+
+    def register(self, name: str, factory: Callable[[], Any], idle_timeout: Optional[float] = None) -> None:
+        """
+        Регистрирует модель без загрузки
+        :param name: имя модели в реестре
+        :param factory: функция, создающая модель
+        :param idle_timeout: через сколько секунд простоя выгружать модель (None - не выгружать)
+        """
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(factory, idle_timeout)
+            if idle_timeout is not None and self._janitor is None:
+                self._janitor = threading.Thread(target=self._unload_idle_loop, daemon=True, name='model-janitor')
+                self._janitor.start()
+
+    def is_registered(self, name: str) -> bool:
+        return name in self._entries
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._entries and self._entries[name].instance is not None
+
+    def get(self, name: str) -> Any:
+        """
+        Возвращает модель, при необходимости загружая ее. Параллельные вызовы дождутся одной загрузки
+        :param name: имя модели в реестре
+        """
+        return self._acquire(name, lease=False)
+
+    def _acquire(self, name: str, lease: bool) -> Any:
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.instance is None:
+                rss_before = _rss_bytes()
+                start = time.time()
+                entry.instance = entry.factory()
+                entry.load_time = time.time() - start
+                entry.rss_delta = _rss_bytes() - rss_before if rss_before else None
+                entry.weights = _weights_bytes(entry.instance)
+                rss = f'+{entry.rss_delta / 2 ** 20:.0f} МБ RSS' if entry.rss_delta is not None else 'RSS неизвестен'
+                print(f'Модель {name} загружена за {entry.load_time:.2f} сек '
+                      f'({rss}, веса {entry.weights / 2 ** 20:.0f} МБ)')
+            entry.last_used = time.time()
+            if lease:
+                entry.active += 1
+            return entry.instance
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """
+        Модель на время использования: пока блок выполняется, модель не будет выгружена
+        :param name: имя модели в реестре
+        """
+        entry = self._entries[name]
+        instance = self._acquire(name, lease=True)
+        try:
+            yield instance
+        finally:
+            with entry.lock:
+                entry.active -= 1
+                entry.last_used = time.time()
+
+    def unload(self, name: str) -> bool:
+        """
+        Выгружает модель, если она сейчас не используется
+        :return: True, если модель была выгружена
+        """
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.instance is None or entry.active:
+                return False
+            entry.instance = None
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        print(f'Модель {name} выгружена после простоя')
+        return True
+
+    def _unload_idle_loop(self) -> None:
+        while True:
+            time.sleep(self._janitor_interval)
+            now = time.time()
+            for name, entry in list(self._entries.items()):
+                if entry.idle_timeout is not None and entry.instance is not None \
+                        and now - entry.last_used > entry.idle_timeout:
+                    self.unload(name)
+
+    def memory_report(self) -> dict:
+        """Состояние моделей: загружена ли, время загрузки, прирост RSS и объем весов (МБ)"""
+        return {
+            name: {
+                'loaded': entry.instance is not None,
+                'load_time': entry.load_time,
+                'rss_delta_mb': entry.rss_delta / 2 ** 20 if entry.rss_delta is not None else None,
+                'weights_mb': entry.weights / 2 ** 20,
+                'idle_sec': time.time() - entry.last_used if entry.last_used else None
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+# Единый реестр процесса
+model_registry = ModelRegistry()
@@ -1,35 +1,161 @@
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
 import pdfplumber
 from pathlib import Path
+from pdfminer.pdftypes import PDFStream, resolve1
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
 
-def pdf_to_text(input_pdf: str | Path, output_txt: str | Path) -> None:
+def _resolve_path(path: str | Path) -> Path:
+    return PROJECT_ROOT / path if not Path(path).is_absolute() else Path(path)
+
+
+def _hash_object(obj, digest, seen: set[int]) -> None:
+    """Добавляет в хэш объект PDF со всем, на что он ссылается (шрифты, ToUnicode, формы XObject)."""
+    objid = getattr(obj, "objid", None)
+    if objid is not None:
+        if objid in seen:
+            digest.update(b"ref%d" % objid)
+            return
+        seen.add(objid)
+    obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        _hash_object(obj.attrs, digest, seen)
+        # Сырые (сжатые) данные: распаковывать шрифты и изображения ради ключа кэша незачем
+        digest.update(obj.rawdata if obj.rawdata is not None else obj.get_data())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            digest.update(str(key).encode())
+            _hash_object(obj[key], digest, seen)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"[")
+        for item in obj:
+            _hash_object(item, digest, seen)
+        digest.update(b"]")
+    else:
+        digest.update(repr(obj).encode())
+
+
+def _page_fingerprint(page) -> Optional[str]:
+    """Хэш содержимого страницы, не зависящий от остального документа.
+
+    Учитываются размеры, потоки команд и ресурсы страницы: одинаковые команды
+    (например, только "/Fm0 Do") с разными шрифтами или формами дают разный текст.
+    """
+    try:
+        digest = hashlib.sha256(repr(page.mediabox).encode())
+        seen: set[int] = set()
+        for stream in page.page_obj.contents:
+            _hash_object(stream, digest, seen)
+        _hash_object(page.page_obj.resources, digest, seen)
+        return digest.hexdigest()
+    except Exception:
+        return None
+
+
+def _extract_page(page, cache_dir: Optional[Path]) -> str:
+    fingerprint = _page_fingerprint(page) if cache_dir is not None else None
+    cache_file = cache_dir / f"{fingerprint}.txt" if fingerprint else None
+    if cache_file is not None and cache_file.exists():
+        return cache_file.read_text(encoding="utf-8")
+
+    text = page.extract_text() or ""
+    if cache_file is not None:
+        # Пишем через временный файл, чтобы параллельные процессы не увидели неполный результат
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_text(text, encoding="utf-8")
+        tmp_file.replace(cache_file)
+    return text
+
+
+def _extract_range(input_path: Path, start: int, end: int, cache_dir: Optional[Path]) -> list[str]:
+    """Извлекает текст страниц [start, end) в отдельном процессе."""
+    with pdfplumber.open(input_path) as pdf:
+        texts = []
+        for page in pdf.pages[start:end]:
+            texts.append(_extract_page(page, cache_dir))
+            page.close()
+        return texts
+
+
+def iter_pages(
+        input_pdf: str | Path,
+        workers: int = 1,
+        cache_dir: str | Path | None = None,
+        range_size: int = 8
+) -> Iterator[str]:
+    """Построчно (по страницам) извлекает текст из PDF.
+
+    Args:
+        input_pdf: Путь к исходному PDF (относительно PROJECT_ROOT или абсолютный)
+        workers: Количество процессов; при workers > 1 диапазоны страниц извлекаются параллельно
+        cache_dir: Каталог постраничного кэша (None — без кэша)
+        range_size: Количество страниц в одном задании для процесса
+
+    Yields:
+        Текст очередной страницы в исходном порядке
+    """
+    input_path = _resolve_path(input_pdf)
+    cache_path = _resolve_path(cache_dir) if cache_dir is not None else None
+    if cache_path is not None:
+        cache_path.mkdir(parents=True, exist_ok=True)
+
+    if workers <= 1:
+        with pdfplumber.open(input_path) as pdf:
+            for page in pdf.pages:
+                yield _extract_page(page, cache_path)
+                # Освобождаем разобранные объекты страницы, чтобы память не росла с документом
+                page.close()
+        return
+
+    with pdfplumber.open(input_path) as pdf:
+        page_count = len(pdf.pages)
+    ranges = deque((start, min(start + range_size, page_count)) for start in range(0, page_count, range_size))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # В работе держим не больше 2 * workers диапазонов — память ограничена несколькими страницами
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                start, end = ranges.popleft()
+                pending.append(executor.submit(_extract_range, input_path, start, end, cache_path))
+            yield from pending.popleft().result()
+
+
+def pdf_to_text(
+        input_pdf: str | Path,
+        output_txt: str | Path,
+        workers: int = 1,
+        cache_dir: str | Path | None = None
+) -> None:
     """Конвертирует PDF в текстовый файл.
 
     Args:
         input_pdf: Путь к исходному PDF (относительно PROJECT_ROOT или абсолютный)
         output_txt: Путь для сохранения TXT (относительно PROJECT_ROOT или абсолютный)
+        workers: Количество процессов для параллельного извлечения страниц
+        cache_dir: Каталог постраничного кэша (None — без кэша)
     """
-    # Приводим пути к абсолютным
-    input_path = PROJECT_ROOT / input_pdf if not Path(input_pdf).is_absolute() else Path(input_pdf)
-    output_path = PROJECT_ROOT / output_txt if not Path(output_txt).is_absolute() else Path(output_txt)
+    output_path = _resolve_path(output_txt)
 
     # Создаем директорию для выходного файла, если её нет
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with pdfplumber.open(input_path) as pdf:
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text() + "\n\n"  # Добавляем пустую строку между страницами
-
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write(text)
+        for text in iter_pages(input_pdf, workers=workers, cache_dir=cache_dir):
+            f.write(text + "\n\n")  # Добавляем пустую строку между страницами
 
 
 if __name__ == "__main__":
     # Пример использования с новой структурой
     pdf_to_text(
         input_pdf="storage/pdf/tk.pdf",
-        output_txt="storage/processed/txt/tk_rf.txt"
-    )
\ No newline at end of file
+        output_txt="storage/processed/txt/tk_rf.txt",
+        workers=os.cpu_count() or 1,
+        cache_dir="storage/cache/pdf_pages"
+    )
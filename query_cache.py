@@ -0,0 +1,132 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+def normalize_question(question: str) -> str:
+    """
+    Приводит вопрос к каноническому виду, чтобы слегка переформулированные
+    вопросы (регистр, знаки препинания, лишние пробелы, ё/е) совпадали
+    :param question: исходный вопрос
+    :return: нормализованный вопрос
+    """
+    question = question.lower().replace('ё', 'е')
+    question = re.sub(r'[^\w\s]', ' ', question)
+    return re.sub(r'\s+', ' ', question).strip()
+
+
+class _LRUTTLCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable):
+        item = self.get_item(key)
+        return None if item is None else item[1]
+
+    def get_item(self, key: Hashable, not_before: float = 0.0) -> Optional[tuple[float, object]]:
+        """Запись (время сохранения, значение); записи старше TTL или сохраненные раньше not_before - промах"""
+        item = self._items.get(key)
+        if item is None or time.time() - item[0] > self.ttl or item[0] < not_before:
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, key: Hashable, value, stored_at: Optional[float] = None) -> None:
+        self._items[key] = (time.time() if stored_at is None else stored_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def drop(self, predicate: Callable[[Hashable], bool]) -> None:
+        for key in [key for key in self._items if predicate(key)]:
+            del self._items[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._items)}
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0):
+        """
+        Общий для всех виджетов кэш эмбеддингов вопросов и результатов векторного поиска
+        :param max_entries: максимальное количество записей в каждом из кэшей (LRU)
+        :param ttl: время жизни записи в секундах (защищает от перезагрузки коллекции из другого процесса)
+        """
+        self._lock = threading.Lock()
+        self.embeddings = _LRUTTLCache(max_entries, ttl)
+        self.results = _LRUTTLCache(max_entries, ttl)
+
+    def get_embedding(self, question: str, embedder):
+        """
+        Эмбеддинг вопроса; модель вызывается только при промахе
+        :param question: вопрос пользователя
+        :param embedder: TextEmbedder
+        :return: эмбеддинг вопроса
+        """
+        key = (getattr(embedder, 'cache_namespace', None), normalize_question(question))
+        with self._lock:
+            embedding = self.embeddings.get(key)
+        if embedding is None:
+            embedding = embedder.text_to_embedding(question)
+            with self._lock:
+                self.embeddings.put(key, embedding)
+        return embedding
+
+    def get_result(self, question: str, collection, n_results: int, compute: Callable[[], object]):
+        """
+        Результат векторного поиска по коллекции; запрос в Chroma выполняется только при промахе
+        :param question: вопрос пользователя
+        :param collection: коллекция, по которой идет поиск
+        :param n_results: количество результатов
+        :param compute: функция, выполняющая поиск при промахе
+        :return: результат compute
+        """
+        return self.get_timed_result(question, collection, n_results, compute)[0]
+
+    def get_timed_result(self, question: str, collection, n_results: int, compute: Callable[[], object],
+                         not_before: float = 0.0) -> tuple[object, float]:
+        """
+        То же, что get_result, но возвращает и время получения результата
+        :param not_before: результаты, полученные раньше (например, до сброса коллекции в другом процессе),
+            считаются устаревшими и пересчитываются
+        :return: (результат compute, время его получения)
+        """
+        # id меняется при пересоздании коллекции, поэтому полная перезаливка не вернет старых результатов
+        key = (collection.name, str(getattr(collection, 'id', '')), normalize_question(question), n_results)
+        with self._lock:
+            item = self.results.get_item(key, not_before)
+        if item is None:
+            # Время фиксируется до запроса: сброс, случившийся во время поиска, делает результат устаревшим
+            retrieved_at = time.time()
+            result = compute()
+            with self._lock:
+                self.results.put(key, result, retrieved_at)
+            return result, retrieved_at
+        return item[1], item[0]
+
+    def invalidate(self, collection_name: Optional[str] = None) -> None:
+        """
+        Сбрасывает результаты поиска по коллекции (или по всем коллекциям)
+        :param collection_name: название перезагруженной коллекции
+        """
+        with self._lock:
+            self.results.drop(lambda key: collection_name is None or key[0] == collection_name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'embeddings': self.embeddings.stats(), 'results': self.results.stats()}
+
+
+# Единый кэш процесса: его используют оба виджета GUI и скрипты загрузки для сброса
+query_cache = QueryCache()
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Literal, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from chroma_access import ChromaAccess, get_chroma
+from context_packer import ContextPacker, PackedContext, approximate_token_count
+from fill_db_story import fill_db_from_json, fill_db_story, get_passages_by_embedding, sentences
+from gigachat_gateway import CircuitOpenError, GigaChatGateway, gigachat_gateway
+from query_cache import query_cache
+from tracing import tracer
+
+load_dotenv()
+
+COLLECTIONS = {"tk_rf", "fairy_tale"}
+
+
+class RetrieveRequest(BaseModel):
+    question: str
+    collection: str = "tk_rf"
+    n_results: int = 3
+
+
+class AskRequest(RetrieveRequest):
+    model: Literal["local", "gigachat"] = "local"
+    temperature: float = 0.3
+    max_length: int = 100
+
+
+class StubEmbedder:
+    def __init__(self, dim: int = 384, delay: float = 0.005):
+        """
+        Детерминированная замена TextEmbedder для нагрузочных прогонов без модели
+        :param dim: размерность векторов
+        :param delay: имитация времени кодирования (сек)
+        """
+        self.embedding_dim = dim
+        self.delay = delay
+        self.cache_namespace = 'stub'
+
+    def text_to_embedding(self, text: str) -> np.ndarray:
+        time.sleep(self.delay)
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+        return np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+
+    def texts_to_embeddings(self, texts, **kwargs) -> np.ndarray:
+        return np.stack([self.text_to_embedding(text) for text in texts])
+
+
+class StubLanguageModel:
+    def __init__(self, delay: float = 0.5):
+        """
+        Замена LanguageModel, имитирующая задержку генерации
+        :param delay: время "генерации" (сек)
+        """
+        self.delay = delay
+
+    def ask(self, question: str, document: str, **kwargs) -> str:
+        time.sleep(self.delay)
+        return f"[stub] {question}"
+
+
+class StubChat:
+    def __init__(self, delay: float = 0.3):
+        self.delay = delay
+
+    async def ainvoke(self, input):
+        await asyncio.sleep(self.delay)
+        return type('StubMessage', (), {'content': f"[stub] {input[-1].content}"})()
+
+    async def astream(self, input):
+        yield await self.ainvoke(input)
+
+
+class ServiceBackends:
+    def __init__(self, stub: bool = False, retrieval_workers: int = 4, generation_workers: int = 8):
+        """
+        Модели и клиенты сервиса. Загружаются в фоне, готовность отдается в /ready
+        :param stub: использовать заглушки вместо моделей, Chroma и GigaChat
+        :param retrieval_workers: потоков для кодирования вопросов и поиска
+        :param generation_workers: потоков, ожидающих локальную генерацию (сами запросы батчит GenerationScheduler)
+        """
+        self.stub = stub
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.retrieval_executor = ThreadPoolExecutor(retrieval_workers, thread_name_prefix='retrieval')
+        self.generation_executor = ThreadPoolExecutor(generation_workers, thread_name_prefix='generation')
+        # Для моделей без локального токенизатора (GigaChat, заглушки) токены контекста оцениваются
+        self.packer = ContextPacker(approximate_token_count, int(os.getenv("GIGACHAT_CONTEXT_TOKENS", "1500")))
+
+    def load(self) -> None:
+        try:
+            if self.stub:
+                from memory_collection import InMemoryClient
+                self.embedder = StubEmbedder()
+                self.client = ChromaAccess(InMemoryClient())
+                with open(os.path.join(os.path.dirname(__file__), 'tk_rf.json'), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                fill_db_from_json(data, embedding_model=self.embedder,
+                                  collection=self.client.create_collection('tk_rf'))
+                fill_db_story(sentences, embedding_model=self.embedder,
+                              collection=self.client.create_collection('fairy_tale'))
+                self.lm = StubLanguageModel()
+                self.gigachat = GigaChatGateway(client_factory=StubChat)
+            else:
+                from embedding_cache import EmbeddingCache
+                from embedding_worker import TextEmbedder
+                from llm_widget import LanguageModel
+                from generation_scheduler import GenerationScheduler
+                # Дескрипторы коллекций кэшируются, одинаковые одновременные запросы объединяются
+                self.client = get_chroma()
+                self.embedder = TextEmbedder(cache=EmbeddingCache())
+                # Запросы к GigaChat идут через общий шлюз: пул соединений, повторы, размыкатель
+                self.gigachat = gigachat_gateway
+                # Одновременные вопросы объединяются в батчи generate
+                self.lm = GenerationScheduler(LanguageModel("TinyLlama/TinyLlama-1.1B-Chat-v1.0"))
+            self.ready.set()
+        except Exception as e:
+            self.error = str(e)
+
+    @tracer.traced
+    def retrieve(self, question: str, collection_name: str, n_results: int, model: str = "local",
+                 max_length: int = 100) -> PackedContext:
+        with tracer.span('collection_lookup', collection=collection_name):
+            collection = self.client.get_collection(collection_name)
+
+        def search():
+            with tracer.span('embedding'):
+                embedding = query_cache.get_embedding(question, self.embedder)
+            return get_passages_by_embedding(embedding=embedding, collection=collection, n_results=n_results)
+
+        passages = query_cache.get_result(
+            question=question,
+            collection=collection,
+            n_results=n_results,
+            compute=search
+        )
+        # Контекст собирается в бюджет токенов модели, которая будет отвечать
+        lm = getattr(self.lm, 'lm', self.lm)
+        if model == "local" and hasattr(lm, 'pack_context'):
+            return lm.pack_context(question, passages, max_length)
+        packed = self.packer.pack(passages)
+        packed.prompt_tokens = approximate_token_count(packed.text + question)
+        return packed
+
+    def generate(self, question: str, context: str, temperature: float, max_length: int) -> Future:
+        """
+        Локальная генерация. Запрос к GenerationScheduler можно отменить, пока он ждет в очереди;
+        заглушка выполняется в пуле генерации
+        """
+        if hasattr(self.lm, 'submit'):
+            return self.lm.submit(question, context, temperature, max_length)
+        return self.generation_executor.submit(self.lm.ask, question=question, document=context,
+                                               temperature=temperature, max_length=max_length)
+
+    def stats(self) -> dict:
+        return {
+            'stages': tracer.summary(),
+            'query_cache': query_cache.stats(),
+            'chroma': self.client.stats(),
+            'generation': self.lm.stats() if hasattr(self.lm, 'stats') else None,
+            'gigachat': self.gigachat.stats()
+        }
+
+    def shutdown(self) -> None:
+        if hasattr(self.lm, 'close'):
+            self.lm.close()
+        self.gigachat.close()
+        for executor in (self.retrieval_executor, self.generation_executor):
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app(stub: bool = False, request_timeout: float = 120.0, max_pending: int = 64) -> FastAPI:
+    """
+    Создает приложение FastAPI. Вся работа с моделями идет в ограниченных пулах потоков,
+    цикл событий только ждет результатов
+    :param stub: использовать заглушки вместо моделей (для нагрузочного тестирования)
+    :param request_timeout: таймаут обработки запроса (сек)
+    :param max_pending: максимум одновременно обрабатываемых запросов; сверх него сервис отвечает 503
+    """
+    backends = ServiceBackends(stub=stub)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Модели грузятся в фоне: /health отвечает сразу, готовность - в /ready
+        threading.Thread(target=backends.load, daemon=True).start()
+        yield
+        backends.shutdown()
+
+    app = FastAPI(title="ChromaMicroservice", lifespan=lifespan)
+    pending = asyncio.Semaphore(max_pending)
+
+    async def run(submit: Callable[[], Future]):
+        """
+        Выполняет работу в фоне с таймаутом. Слот занят, пока работа действительно не закончится:
+        по таймауту клиент сразу получает 504, но поток, уже занятый поиском или генерацией,
+        продолжает считаться в max_pending
+        :param submit: запускает работу и возвращает ее Future
+        """
+        if pending.locked():
+            raise HTTPException(status_code=503, detail="Сервис перегружен")
+        await pending.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = submit()
+        except BaseException:
+            pending.release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(pending.release))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), request_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Превышено время обработки запроса")
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        finally:
+            # Таймаут или отключение клиента: запрос, еще ждущий в очереди, снимается,
+            # запрос к GigaChat прерывается; для завершенной работы отмена ничего не делает
+            future.cancel()
+
+    def check_request(request: RetrieveRequest) -> None:
+        if not backends.ready.is_set():
+            raise HTTPException(status_code=503, detail="Сервис еще загружается")
+        if request.collection not in COLLECTIONS:
+            raise HTTPException(status_code=404, detail=f"Неизвестная коллекция {request.collection}")
+        if not request.question.strip():
+            raise HTTPException(status_code=400, detail="Пустой вопрос")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    async def ready():
+        if backends.error is not None:
+            raise HTTPException(status_code=500, detail=backends.error)
+        if not backends.ready.is_set():
+            raise HTTPException(status_code=503, detail="Сервис еще загружается")
+        return {"status": "ready", "stub": stub}
+
+    @app.get("/stats")
+    async def stats():
+        if not backends.ready.is_set():
+            raise HTTPException(status_code=503, detail="Сервис еще загружается")
+        return backends.stats()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        # Гистограммы этапов в формате Prometheus
+        return tracer.prometheus_text()
+
+    @app.post("/retrieve")
+    async def retrieve(request: RetrieveRequest):
+        check_request(request)
+        start = time.time()
+        packed = await run(lambda: backends.retrieval_executor.submit(
+            backends.retrieve, request.question, request.collection, request.n_results))
+        return {"context": packed.text, "prompt_tokens": packed.prompt_tokens, "elapsed": time.time() - start}
+
+    @app.post("/ask")
+    async def ask(request: AskRequest):
+        check_request(request)
+        start = time.time()
+        packed = await run(lambda: backends.retrieval_executor.submit(
+            backends.retrieve, request.question, request.collection, request.n_results, request.model,
+            request.max_length))
+        context = packed.text
+        retrieval_time = time.time() - start
+        if request.model == "local":
+            answer = await run(lambda: backends.generate(request.question, context, request.temperature,
+                                                         request.max_length))
+        else:
+            answer = await run(lambda: backends.gigachat.submit(request.question, context))
+        return {
+            "answer": answer,
+            "context": context,
+            "prompt_tokens": packed.prompt_tokens,
+            "retrieval_time": retrieval_time,
+            "elapsed": time.time() - start
+        }
+
+    return app
+
+
+async def load_test(url: str, path: str = "/retrieve", concurrency: int = 16, requests: int = 200,
+                    payload: Optional[dict] = None) -> dict:
+    """
+    Простой нагрузочный тест: requests запросов при concurrency одновременных
+    :return: пропускная способность и перцентили задержки
+    """
+    import httpx
+
+    payload = payload or {"question": "Как уволиться с работы?", "collection": "tk_rf", "model": "local"}
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                start = time.time()
+                response = await client.post(path, json={**payload, "question": f"{payload['question']} {i % 20}"})
+                latencies.append(time.time() - start)
+                errors += response.status_code != 200
+
+        start = time.time()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.time() - start
+
+    latencies = np.array(latencies)
+    report = {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99))
+    }
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP-сервис поиска по ТК РФ и ответов LLM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--stub", action="store_true", help="заглушки вместо моделей, Chroma и GigaChat")
+    serve_parser.add_argument("--timeout", type=float, default=120.0)
+    load_parser = subparsers.add_parser("loadtest")
+    load_parser.add_argument("--url", default="http://localhost:8080")
+    load_parser.add_argument("--path", default="/retrieve", choices=["/retrieve", "/ask"])
+    load_parser.add_argument("--concurrency", type=int, default=16)
+    load_parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import logging
+        import uvicorn
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+        uvicorn.run(create_app(stub=args.stub, request_timeout=args.timeout), host=args.host, port=args.port)
+    else:
+        asyncio.run(load_test(args.url, args.path, args.concurrency, args.requests))
@@ -1,50 +1,139 @@
 import re
 import json
 from pathlib import Path
+from typing import Iterable, Iterator
 
 # Получаем абсолютный путь к корню проекта (app/)
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
+ARTICLE_PATTERN = r"^\s*Статья\s(\d+)\."
+
+
+def _resolve_path(path: str | Path) -> Path:
+    return PROJECT_ROOT / path if not Path(path).is_absolute() else Path(path)
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Превращает поток фрагментов текста (например, страниц PDF) в поток строк.
+
+    Конец каждого фрагмента считается концом строки: pdfplumber отдает страницу
+    без завершающего перевода строки, и без этого заголовок статьи в начале
+    страницы склеился бы с последней строкой предыдущей.
+
+    Args:
+        chunks: Фрагменты текста из одной или нескольких целых строк
+
+    Yields:
+        Строки без завершающего перевода строки
+    """
+    for chunk in chunks:
+        yield from chunk.removesuffix("\n").split("\n")
+
+
+def iter_articles(
+        lines: Iterable[str],
+        pattern: str = ARTICLE_PATTERN
+) -> Iterator[tuple[str, str]]:
+    """Разбивает поток строк ТК РФ на статьи за один проход.
+
+    Статья отдается, как только встречается заголовок следующей статьи,
+    поэтому в памяти хранится только текущая статья.
+
+    Args:
+        lines: Строки исходного текста
+        pattern: Регулярное выражение заголовка статьи (применяется к каждой строке)
+
+    Yields:
+        Пары ("Статья N", текст статьи)
+    """
+    regex = re.compile(pattern)
+    article_num = None
+    buffer = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = regex.match(line)
+        if match:
+            # Первый фрагмент - всё до Статьи 1 (игнорируем)
+            if article_num is not None:
+                yield f"Статья {article_num}", "\n".join(buffer).strip()
+            article_num = match.group(1).strip()
+            buffer = [line[match.end():]]
+        elif article_num is not None:
+            buffer.append(line)
+
+    if article_num is not None:
+        yield f"Статья {article_num}", "\n".join(buffer).strip()
+
+
+def read_articles_jsonl(input_jsonl: str | Path) -> Iterator[tuple[str, str]]:
+    """Читает статьи из JSON Lines, записанного split_articles_to_jsonl."""
+    with open(_resolve_path(input_jsonl), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["article"], record["text"]
+
+
+def split_articles_to_jsonl(
+        input_txt: str | Path,
+        output_jsonl: str | Path,
+        pattern: str = ARTICLE_PATTERN
+) -> None:
+    """Разбивает текст ТК РФ на статьи и построчно сохраняет в JSON Lines.
+
+    Args:
+        input_txt: Путь к текстовому файлу
+        output_jsonl: Путь для сохранения JSONL (по одной статье в строке)
+        pattern: Регулярное выражение заголовка статьи
+    """
+    output_path = _resolve_path(output_jsonl)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(_resolve_path(input_txt), "r", encoding="utf-8") as src, \
+            open(output_path, "w", encoding="utf-8") as dst:
+        for article, text in iter_articles(src, pattern):
+            dst.write(json.dumps({"article": article, "text": text}, ensure_ascii=False) + "\n")
+
 
 def split_articles_to_json(
         input_txt: str | Path,
         output_json: str | Path,
-        pattern: str = r"(?<=\n)\s*Статья\s(\d+)\."
+        pattern: str = ARTICLE_PATTERN
 ) -> None:
     """Разбивает текст ТК РФ на статьи и сохраняет в JSON.
 
     Args:
         input_txt: Путь к текстовому файлу
         output_json: Путь для сохранения JSON
-        pattern: Регулярное выражение для разделения статей
+        pattern: Регулярное выражение заголовка статьи (применяется к каждой строке)
     """
     # Приводим пути к абсолютным
-    input_path = PROJECT_ROOT / input_txt if not Path(input_txt).is_absolute() else Path(input_txt)
-    output_path = PROJECT_ROOT / output_json if not Path(output_json).is_absolute() else Path(output_json)
+    input_path = _resolve_path(input_txt)
+    output_path = _resolve_path(output_json)
 
-    # Чтение исходного файла
-    with open(input_path, "r", encoding="utf-8") as file:
-        text = file.read()
-
-    # Разделение на статьи с сохранением номеров
-    articles = re.split(pattern, text)
-
-    # Первый элемент - всё до Статьи 1 (игнорируем)
-    articles_data = {}
-    for i in range(1, len(articles), 2):
-        if i + 1 < len(articles):
-            article_num = articles[i].strip()
-            article_text = articles[i + 1].strip()
-            articles_data[f"Статья {article_num}"] = article_text
-
-    # Сохранение JSON
+    # Сохранение JSON по мере чтения статей, без промежуточного словаря
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(articles_data, f, ensure_ascii=False, indent=4)
+    with open(input_path, "r", encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for ind, (article, text) in enumerate(iter_articles(src, pattern)):
+            f.write(("," if ind else "") + "\n    ")
+            f.write(f"{json.dumps(article, ensure_ascii=False)}: {json.dumps(text, ensure_ascii=False)}")
+        f.write("\n}")
 
 
 if __name__ == "__main__":
     split_articles_to_json(
         input_txt="storage/processed/txt/tk_rf.txt",
         output_json="storage/processed/json/tk_rf.json"
-    )
\ No newline at end of file
+    )
+
+    # Либо сразу из PDF в коллекцию, без промежуточных файлов
+    # (полный конвейер с контрольными точками - ingest.py):
+    # from chroma_access import get_chroma
+    # from pdf_to_txt import iter_pages
+    # from embedding_worker import TextEmbedder
+    # from fill_db_story import fill_db_bulk
+    # fill_db_bulk(
+    #     iter_articles(iter_lines(iter_pages("storage/pdf/tk.pdf"))),
+    #     embedding_model=TextEmbedder(),
+    #     collection=get_chroma().get_or_create_collection("tk_rf")
+    # )
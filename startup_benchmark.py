@@ -0,0 +1,53 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = ['torch', 'transformers', 'chromadb', 'sentence_transformers', 'langchain_gigachat', 'gui']
+ROOT = Path(__file__).parent
+
+
+def measure_import(module: str) -> float:
+    """Время импорта модуля в чистом процессе (сек)"""
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_gui_startup() -> dict:
+    """Запускает gui.py в режиме замера: приложение закрывается после прогрева всех компонентов"""
+    output = subprocess.run([sys.executable, 'gui.py', '--startup-benchmark'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def find_regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    return [
+        f'{key}: {current[key]:.2f} сек против {value:.2f} сек в базовом замере'
+        for key, value in baseline.items()
+        if key in current and current[key] > value * (1 + tolerance) + 0.05
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замер холодного старта gui.py')
+    parser.add_argument('--baseline', default='startup_baseline.json', help='файл с базовым замером')
+    parser.add_argument('--save', action='store_true', help='сохранить текущий замер как базовый')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое замедление (доля)')
+    args = parser.parse_args()
+
+    results = {f'import_{module}': measure_import(module) for module in HEAVY_MODULES}
+    results.update(measure_gui_startup())
+    for key, value in results.items():
+        print(f'{key}: {value:.2f} сек')
+
+    baseline_path = ROOT / args.baseline
+    if args.save:
+        baseline_path.write_text(json.dumps(results, indent=4), encoding='utf-8')
+    elif baseline_path.exists():
+        regressions = find_regressions(results, json.loads(baseline_path.read_text(encoding='utf-8')),
+                                       args.tolerance)
+        for line in regressions:
+            print(f'Регрессия: {line}')
+        sys.exit(1 if regressions else 0)
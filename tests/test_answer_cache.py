@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+import pytest
+
+from answer_cache import SemanticAnswerCache, invalidate_persisted_answers
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'answers.sqlite')
+
+
+def _vector(*values) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+
+def test_similarity_threshold(cache_path):
+    cache = SemanticAnswerCache(cache_path, threshold=0.9)
+    cache.store('отпуск', _vector(1, 0, 0), 'tk_rf', 'TinyLlama', '28 дней', latency=2.0)
+
+    assert cache.lookup(_vector(1, 0.1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+    assert cache.lookup(_vector(1, 1, 0), 'tk_rf', 'TinyLlama') is None
+    # Ответ привязан к коллекции, модели и версии коллекции
+    assert cache.lookup(_vector(1, 0, 0), 'fairy_tale', 'TinyLlama') is None
+    assert cache.lookup(_vector(1, 0, 0), 'tk_rf', 'GigaChat') is None
+    assert cache.lookup(_vector(1, 0, 0), 'tk_rf', 'TinyLlama', version='другая') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['latency_saved'] == 2.0
+
+
+def test_ttl_expires_answers(cache_path):
+    cache = SemanticAnswerCache(cache_path, ttl=0.05)
+    cache.store('отпуск', _vector(1, 0), 'tk_rf', 'TinyLlama', '28 дней', latency=1.0)
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+    time.sleep(0.1)
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') is None
+
+
+def test_lru_evicts_least_recently_used(cache_path):
+    cache = SemanticAnswerCache(cache_path, max_entries=2, touch_interval=0)
+    cache.store('a', _vector(1, 0, 0), 'tk_rf', 'TinyLlama', 'A', latency=1.0)
+    time.sleep(0.01)
+    cache.store('b', _vector(0, 1, 0), 'tk_rf', 'TinyLlama', 'B', latency=1.0)
+    time.sleep(0.01)
+    assert cache.lookup(_vector(1, 0, 0), 'tk_rf', 'TinyLlama') == 'A'
+    time.sleep(0.01)
+    cache.store('c', _vector(0, 0, 1), 'tk_rf', 'TinyLlama', 'C', latency=1.0)
+
+    assert cache.lookup(_vector(1, 0, 0), 'tk_rf', 'TinyLlama') == 'A'
+    assert cache.lookup(_vector(0, 1, 0), 'tk_rf', 'TinyLlama') is None
+    assert cache.lookup(_vector(0, 0, 1), 'tk_rf', 'TinyLlama') == 'C'
+
+
+def test_hits_do_not_write_within_touch_interval(cache_path):
+    cache = SemanticAnswerCache(cache_path, touch_interval=3600)
+    cache.store('отпуск', _vector(1, 0), 'tk_rf', 'TinyLlama', '28 дней', latency=1.0)
+    changes = cache._conn.total_changes
+    for _ in range(5):
+        assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+    assert cache._conn.total_changes == changes
+
+    touching = SemanticAnswerCache(cache_path, touch_interval=0)
+    assert touching.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+    assert touching._conn.total_changes == 1
+
+
+def test_invalidation(cache_path):
+    cache = SemanticAnswerCache(cache_path)
+    cache.store('отпуск', _vector(1, 0), 'tk_rf', 'TinyLlama', '28 дней', latency=1.0)
+    cache.store('репка', _vector(1, 0), 'fairy_tale', 'TinyLlama', 'вытащили', latency=1.0)
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+
+    cache.invalidate('tk_rf')
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') is None
+    assert cache.lookup(_vector(1, 0), 'fairy_tale', 'TinyLlama') == 'вытащили'
+
+    # Сброс из другого процесса (скрипт загрузки) виден без перезапуска
+    invalidate_persisted_answers('fairy_tale', cache_path)
+    assert cache.lookup(_vector(1, 0), 'fairy_tale', 'TinyLlama') is None
+
+
+def test_answer_from_results_older_than_invalidation_is_not_stored(cache_path):
+    cache = SemanticAnswerCache(cache_path)
+    retrieved_at = time.time()
+    time.sleep(0.01)
+    # Коллекцию перезагрузил другой процесс, пока отвечала модель
+    invalidate_persisted_answers('tk_rf', cache_path)
+    assert cache.invalidated_at('tk_rf') > retrieved_at
+    assert cache.invalidated_at('fairy_tale') == 0.0
+
+    assert not cache.store('отпуск', _vector(1, 0), 'tk_rf', 'TinyLlama', 'старый ответ', latency=1.0,
+                           retrieved_at=retrieved_at)
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') is None
+    assert cache.store('отпуск', _vector(1, 0), 'tk_rf', 'TinyLlama', '28 дней', latency=1.0,
+                       retrieved_at=time.time())
+    assert cache.lookup(_vector(1, 0), 'tk_rf', 'TinyLlama') == '28 дней'
+
+
+def test_query_cache_recomputes_results_older_than_invalidation():
+    from query_cache import QueryCache
+
+    class _Collection:
+        name, id = 'tk_rf', 'id-1'
+
+    calls = []
+    cache = QueryCache()
+    compute = lambda: calls.append(1) or len(calls)
+    result, retrieved_at = cache.get_timed_result('отпуск?', _Collection(), 3, compute)
+    assert cache.get_timed_result('Отпуск', _Collection(), 3, compute) == (result, retrieved_at)
+
+    result, later = cache.get_timed_result('отпуск', _Collection(), 3, compute, not_before=time.time())
+    assert (result, len(calls)) == (2, 2)
+    assert later > retrieved_at
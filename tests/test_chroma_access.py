@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chroma_access import AsyncChromaAccess, ChromaAccess
+
+
+class NotFoundError(Exception):
+    """Та же ошибка по имени, что и в chromadb 1.x для удаленной коллекции"""
+
+
+class _FakeCollection:
+    def __init__(self, client, name: str, generation: int):
+        self.client = client
+        self.name = name
+        self.generation = generation
+
+    def query(self, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        with self.client.lock:
+            self.client.queries += 1
+        self.client.started.set()
+        self.client.gate.wait(5)
+        if self.client.error is not None:
+            raise self.client.error
+        if self.generation != self.client.generation:
+            raise NotFoundError(f'Collection {self.name} does not exist')
+        return {'ids': [[f'{self.name}-{self.generation}']], 'n_results': n_results}
+
+
+class _FakeClient:
+    def __init__(self):
+        """Клиент Chroma, считающий обращения; пересоздание коллекции делает старые дескрипторы недействительными"""
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.get_calls = 0
+        self.generation = 0
+        self.error = None
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get_collection(self, name: str, **kwargs) -> _FakeCollection:
+        with self.lock:
+            self.get_calls += 1
+        return _FakeCollection(self, name, self.generation)
+
+    def recreate(self) -> None:
+        self.generation += 1
+
+
+class _FakeAsyncCollection:
+    def __init__(self, client, name: str, generation: int):
+        self.client = client
+        self.name = name
+        self.generation = generation
+
+    async def query(self, query_embeddings, n_results: int = 10, **kwargs) -> dict:
+        self.client.queries += 1
+        await asyncio.sleep(0.01)
+        if self.client.error is not None:
+            raise self.client.error
+        if self.generation != self.client.generation:
+            raise NotFoundError(f'Collection {self.name} does not exist')
+        return {'ids': [[f'{self.name}-{self.generation}']]}
+
+
+class _FakeAsyncClient:
+    def __init__(self):
+        self.queries = 0
+        self.get_calls = 0
+        self.generation = 0
+        self.error = None
+
+    async def get_collection(self, name: str, **kwargs) -> _FakeAsyncCollection:
+        self.get_calls += 1
+        return _FakeAsyncCollection(self, name, self.generation)
+
+
+def _query_concurrently(collection, embeddings: list, threads_per_embedding: int) -> list:
+    results, errors = [], []
+
+    def worker(embedding):
+        try:
+            results.append(collection.query([embedding], n_results=3))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(embedding,))
+               for embedding in embeddings for _ in range(threads_per_embedding)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _release_when_merged(client, access, expected: int) -> None:
+    # Первый запрос держит сервер, пока остальные не присоединятся к нему
+    assert client.started.wait(5)
+    deadline = time.time() + 5
+    while access.single_flight.merged < expected and time.time() < deadline:
+        time.sleep(0.005)
+    client.gate.set()
+
+
+def test_concurrent_identical_queries_hit_server_once():
+    client = _FakeClient()
+    access = ChromaAccess(client)
+    collection = access.get_collection('tk_rf')
+    client.gate.clear()
+
+    threads, results, errors = _query_concurrently(collection, [[1.0, 0.0]], threads_per_embedding=8)
+    _release_when_merged(client, access, 7)
+    for thread in threads:
+        thread.join(5)
+
+    assert not errors
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    assert client.queries == 1
+    assert access.stats()['merged_queries'] == 7
+    assert client.get_calls == 1
+
+    # Разные вопросы не объединяются, а завершенный запрос не отдается повторно
+    collection.query([[0.0, 1.0]], n_results=3)
+    collection.query([[1.0, 0.0]], n_results=5)
+    assert client.queries == 3
+
+
+def test_error_reaches_every_merged_caller():
+    client = _FakeClient()
+    access = ChromaAccess(client)
+    collection = access.get_collection('tk_rf')
+    client.gate.clear()
+    client.error = ConnectionError('сервер недоступен')
+
+    threads, results, errors = _query_concurrently(collection, [[1.0, 0.0]], threads_per_embedding=4)
+    _release_when_merged(client, access, 3)
+    for thread in threads:
+        thread.join(5)
+
+    assert not results
+    assert len(errors) == 4 and all(isinstance(error, ConnectionError) for error in errors)
+    assert client.queries == 1
+    # Ключ освобожден: следующий запрос снова идет на сервер
+    client.error = None
+    assert collection.query([[1.0, 0.0]], n_results=3)['ids'] == [['tk_rf-0']]
+    assert client.queries == 2
+
+
+def test_stale_handle_is_refreshed_and_retried_once():
+    client = _FakeClient()
+    access = ChromaAccess(client)
+    access.get_collection('tk_rf')
+    client.recreate()
+
+    assert access.query('tk_rf', [[1.0, 0.0]])['ids'] == [['tk_rf-1']]
+    assert client.queries == 2
+    assert client.get_calls == 2
+
+
+@pytest.mark.parametrize('error', [ConnectionError('сеть'), ValueError('n_results должно быть больше 0')])
+def test_other_errors_are_not_retried(error):
+    client = _FakeClient()
+    access = ChromaAccess(client)
+    client.error = error
+
+    with pytest.raises(type(error)):
+        access.query('tk_rf', [[1.0, 0.0]])
+    assert client.queries == 1
+    # Дескриптор не сброшен: ошибка не означает, что коллекцию пересоздали
+    assert client.get_calls == 1
+    client.error = None
+    access.query('tk_rf', [[1.0, 0.0]])
+    assert client.get_calls == 1
+
+
+def test_async_access_merges_queries_and_retries_only_stale_handles():
+    async def scenario():
+        client = _FakeAsyncClient()
+        access = AsyncChromaAccess(client)
+        results = await asyncio.gather(*[access.query('tk_rf', [[1.0, 0.0]]) for _ in range(5)])
+        assert all(result == results[0] for result in results)
+        assert (client.queries, access.merged) == (1, 4)
+
+        client.generation += 1
+        assert (await access.query('tk_rf', [[1.0, 0.0]]))['ids'] == [['tk_rf-1']]
+        assert (client.queries, client.get_calls) == (3, 2)
+
+        client.error = ConnectionError('сеть')
+        with pytest.raises(ConnectionError):
+            await access.query('tk_rf', [[1.0, 0.0]])
+        assert (client.queries, client.get_calls) == (4, 2)
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+from context_packer import ContextPacker, split_sentences
+
+
+class _WordCounter:
+    """Токен - слово; считает вызовы, чтобы проверить, сколько раз токенизируется текст"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text: str) -> int:
+        self.calls += 1
+        return len(text.split())
+
+
+def test_pack_orders_passages_by_distance():
+    packer = ContextPacker(_WordCounter(), max_tokens=100)
+    packed = packer.pack([('Дальний фрагмент.', 0.9), ('Ближний фрагмент.', 0.1), ('Средний фрагмент.', 0.5)])
+
+    assert packed.text == '1. Ближний фрагмент.\n2. Средний фрагмент.\n3. Дальний фрагмент.\n'
+    assert packed.passages == 3
+    assert not packed.truncated
+
+
+def test_pack_skips_duplicate_passages():
+    packer = ContextPacker(_WordCounter(), max_tokens=100)
+    packed = packer.pack([
+        ('Отпуск длится 28 дней. Его можно разделить.', 0.1),
+        # Тот же текст с другим регистром и переносами строк из PDF
+        ('отпуск длится  28 дней.\nЕго можно разделить.', 0.2),
+        ('Отпуск длится 28 дней. Работник пишет заявление.', 0.3),
+    ])
+
+    assert packed.duplicates == 1
+    assert packed.passages == 2
+    # Уже включенное предложение второй раз не попадает в контекст
+    assert packed.text.count('Отпуск длится 28 дней.') == 1
+    assert '2. Работник пишет заявление.' in packed.text
+
+
+def test_pack_respects_budget():
+    counter = _WordCounter()
+    packer = ContextPacker(counter, max_tokens=8)
+    packed = packer.pack([('Раз два три. Четыре пять шесть.', 0.1), ('Семь восемь девять.', 0.2)])
+
+    assert packed.truncated
+    assert packed.text == '1. Раз два три. Четыре пять шесть.\n'
+    assert packed.tokens == counter(packed.text) <= 8
+
+    # Первое предложение длиннее бюджета режется по словам
+    packed = ContextPacker(_WordCounter(), max_tokens=3).pack([('Одно очень длинное предложение без точек', 0.1)])
+    assert packed.text == '1. Одно очень\n'
+    assert packed.truncated
+
+
+def test_trim_cuts_at_sentence_boundary_with_few_tokenizer_calls():
+    sentences = [f'Пункт {i} закончен.' for i in range(200)]
+    text = '\n'.join(' '.join(sentences[row:row + 10]) for row in range(0, 200, 10))
+    counter = _WordCounter()
+    packer = ContextPacker(counter, max_tokens=100)
+
+    trimmed = packer.trim(text)
+
+    assert len(trimmed.split()) == 99
+    assert split_sentences(trimmed.replace('\n', ' ')) == sentences[:33]
+    assert text.startswith(trimmed)
+    # Двоичный поиск по границам предложений, а не токенизация растущего префикса
+    assert counter.calls <= 10
+    assert packer.trim('Короткий текст.') == 'Короткий текст.'
+    assert packer.trim('Одно очень длинное предложение', max_tokens=2) == 'Одно очень'
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from generation_scheduler import GenerationScheduler
+
+
+class _FakeLanguageModel:
+    def __init__(self, error: Exception = None):
+        """Записывает вызовы ask_batch; первый вызов можно задержать до release()"""
+        self.calls = []
+        self.error = error
+        self.started = threading.Event()
+        self._gate = threading.Event()
+        self._gate.set()
+
+    def hold(self) -> None:
+        self._gate.clear()
+
+    def release(self) -> None:
+        self._gate.set()
+
+    def ask_batch(self, requests, temperature=0.7, max_length=100, return_token_counts=False):
+        self.calls.append((temperature, max_length, [question for question, _ in requests]))
+        self.started.set()
+        self._gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return [(f'ответ {question}', 1) for question, _ in requests]
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(lm, **kwargs):
+        scheduler = GenerationScheduler(lm, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+
+def _block_worker(lm, scheduler):
+    """Занимает рабочий поток первым запросом, чтобы следующие гарантированно скопились в очереди"""
+    lm.hold()
+    first = scheduler.submit('первый', 'документ')
+    assert lm.started.wait(5)
+    return first
+
+
+def test_batches_group_by_generation_params(make_scheduler):
+    lm = _FakeLanguageModel()
+    scheduler = make_scheduler(lm, max_batch_size=4, max_wait_ms=50)
+    first = _block_worker(lm, scheduler)
+    futures = [scheduler.submit(f'q{i}', 'документ', temperature=0.7 if i % 2 else 0.3,
+                                max_length=100 if i % 2 else 50) for i in range(4)]
+    lm.release()
+
+    assert first.result(5) == 'ответ первый'
+    assert [future.result(5) for future in futures] == [f'ответ q{i}' for i in range(4)]
+    for temperature, max_length, questions in lm.calls[1:]:
+        expected = {(0.7, 100): {'q1', 'q3'}, (0.3, 50): {'q0', 'q2'}}[(temperature, max_length)]
+        assert set(questions) == expected
+    assert len(lm.calls) == 3
+
+
+def test_batch_size_limit(make_scheduler):
+    lm = _FakeLanguageModel()
+    scheduler = make_scheduler(lm, max_batch_size=2, max_wait_ms=50)
+    _block_worker(lm, scheduler)
+    futures = [scheduler.submit(f'q{i}', 'документ') for i in range(5)]
+    lm.release()
+
+    assert [future.result(5) for future in futures] == [f'ответ q{i}' for i in range(5)]
+    assert all(len(questions) <= 2 for _, _, questions in lm.calls)
+    assert scheduler.stats()['requests'] == 6
+
+
+def test_single_request_waits_no_longer_than_window(make_scheduler):
+    lm = _FakeLanguageModel()
+    scheduler = make_scheduler(lm, max_batch_size=8, max_wait_ms=30)
+    start = time.time()
+    assert scheduler.submit('q', 'документ').result(5) == 'ответ q'
+    assert time.time() - start < 1.0
+
+    # Запрос, пришедший после окна ожидания, попадает в следующий батч
+    time.sleep(0.1)
+    scheduler.submit('позже', 'документ').result(5)
+    assert [questions for _, _, questions in lm.calls] == [['q'], ['позже']]
+
+
+def test_cancelled_requests_are_skipped(make_scheduler):
+    lm = _FakeLanguageModel()
+    scheduler = make_scheduler(lm, max_batch_size=4, max_wait_ms=20)
+    _block_worker(lm, scheduler)
+    cancelled = scheduler.submit('отменен', 'документ')
+    assert cancelled.cancel()
+    kept = scheduler.submit('оставлен', 'документ')
+    lm.release()
+
+    assert kept.result(5) == 'ответ оставлен'
+    assert cancelled.cancelled()
+    assert all('отменен' not in questions for _, _, questions in lm.calls)
+    # Рабочий поток продолжает обслуживать очередь
+    assert scheduler.submit('после', 'документ').result(5) == 'ответ после'
+
+
+def test_ask_batch_error_reaches_every_waiter(make_scheduler):
+    lm = _FakeLanguageModel(error=RuntimeError('нет памяти'))
+    scheduler = make_scheduler(lm, max_batch_size=4, max_wait_ms=20)
+    first = _block_worker(lm, scheduler)
+    futures = [scheduler.submit(f'q{i}', 'документ') for i in range(3)]
+    lm.release()
+
+    for future in [first] + futures:
+        with pytest.raises(RuntimeError, match='нет памяти'):
+            future.result(5)
+    lm.error = None
+    assert scheduler.submit('снова', 'документ').result(5) == 'ответ снова'
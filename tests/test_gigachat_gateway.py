@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('langchain_core')
+
+from gigachat_gateway import CircuitBreaker, CircuitOpenError, GigaChatGateway
+
+
+class _FakeClient:
+    def __init__(self, failures: int = 0, first_chunk_delay: float = 0.0, fail_after_chunk: bool = False):
+        """Клиент с ainvoke/astream, как у GigaChat: первые failures вызовов падают"""
+        self.failures = failures
+        self.first_chunk_delay = first_chunk_delay
+        self.fail_after_chunk = fail_after_chunk
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def _fail_if_needed(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('API недоступен')
+
+    async def ainvoke(self, messages):
+        self._fail_if_needed()
+        return SimpleNamespace(content='28 дней')
+
+    async def astream(self, messages):
+        self._fail_if_needed()
+        try:
+            await asyncio.sleep(self.first_chunk_delay)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        yield SimpleNamespace(content='28 ')
+        if self.fail_after_chunk:
+            raise ConnectionError('обрыв соединения')
+        yield SimpleNamespace(content='дней')
+
+
+@pytest.fixture
+def make_gateway():
+    gateways = []
+
+    def make(client, **kwargs):
+        gateway = GigaChatGateway(client_factory=lambda: client, base_delay=0.0, **kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    # Пропускается только один пробный запрос; его ошибка снова размыкает цепь
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_backoff_uses_full_jitter_within_limits():
+    gateway = GigaChatGateway(client_factory=lambda: None, base_delay=0.5, max_delay=2.0)
+    for attempt, limit in [(0, 0.5), (1, 1.0), (2, 2.0), (10, 2.0)]:
+        delays = [gateway._backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= limit for delay in delays)
+        # Полный джиттер: задержки разбросаны по всему интервалу, а не собраны у верхней границы
+        assert min(delays) < limit * 0.25 and max(delays) > limit * 0.75
+
+
+def test_retries_count_as_one_breaker_failure(make_gateway):
+    client = _FakeClient(failures=2)
+    gateway = make_gateway(client, max_retries=2, breaker=CircuitBreaker(failure_threshold=2))
+    assert gateway.invoke('отпуск', 'контекст') == '28 дней'
+    assert gateway.stats()['retries'] == 2
+
+    client.failures, client.calls = 100, 0
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            gateway.invoke('отпуск', 'контекст')
+    assert client.calls == 6
+    # Цепь разомкнута: запрос отклоняется без обращения к API
+    with pytest.raises(CircuitOpenError):
+        gateway.invoke('отпуск', 'контекст')
+    assert client.calls == 6
+    assert gateway.stats()['circuit'] == 'open'
+
+
+def test_stream_is_not_retried_after_first_chunk(make_gateway):
+    client = _FakeClient(fail_after_chunk=True)
+    gateway = make_gateway(client, max_retries=3)
+    received = []
+    with pytest.raises(ConnectionError):
+        for text in gateway.stream('отпуск', 'контекст'):
+            received.append(text)
+    assert received == ['28 ']
+    assert client.calls == 1
+
+
+def test_stream_cancel_does_not_wait_for_first_chunk(make_gateway):
+    client = _FakeClient(first_chunk_delay=10.0)
+    gateway = make_gateway(client, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.0))
+    stop_event = threading.Event()
+    threading.Timer(0.1, stop_event.set).start()
+
+    start = time.time()
+    assert list(gateway.stream('отпуск', 'контекст', stop_event=stop_event, poll_interval=0.02)) == []
+    assert time.time() - start < 1.0
+    # Запрос к API отменен и не засчитан размыкателю как ошибка
+    assert client.cancelled.wait(1.0)
+    assert gateway.breaker.state == 'closed'
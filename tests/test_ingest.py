@@ -0,0 +1,105 @@
+import gc
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from spliter import iter_articles, iter_lines, split_articles_to_json
+
+TK_RF_TXT = Path(__file__).resolve().parent.parent / 'tk_rf.txt'
+
+
+def _pages_split_before_headings(text: str) -> list[str]:
+    """Страницы без завершающего перевода строки, каждая начинается с заголовка статьи (худший случай)"""
+    pages, page = [], []
+    for line in text.split('\n'):
+        if line.lstrip().startswith('Статья ') and page:
+            pages.append('\n'.join(page))
+            page = []
+        page.append(line)
+    pages.append('\n'.join(page))
+    return pages
+
+
+def _articles_from_text(text: str, tmp_path: Path) -> dict:
+    (tmp_path / 'tk_rf.txt').write_text(text, encoding='utf-8')
+    split_articles_to_json(tmp_path / 'tk_rf.txt', tmp_path / 'tk_rf.json')
+    return json.loads((tmp_path / 'tk_rf.json').read_text(encoding='utf-8'))
+
+
+class _FakeEmbedder:
+    def texts_to_embeddings(self, texts, verbose=False):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_page_stream_matches_split_articles_to_json(tmp_path):
+    pages = _pages_split_before_headings(TK_RF_TXT.read_text(encoding='utf-8'))
+    expected = _articles_from_text('\n\n'.join(pages), tmp_path)
+
+    articles = dict(iter_articles(iter_lines(pages)))
+
+    assert len(expected) > 400
+    assert len(articles) == len(expected)
+    assert articles == expected
+
+
+def test_ingest_checkpoint_text_matches_split_articles_to_json(tmp_path, monkeypatch):
+    ingest = pytest.importorskip('ingest')
+    from memory_collection import InMemoryCollection
+
+    pages = _pages_split_before_headings(TK_RF_TXT.read_text(encoding='utf-8'))
+    monkeypatch.setattr(ingest, 'iter_pages', lambda *args, **kwargs: iter(pages))
+    collection = InMemoryCollection('tk_rf_test')
+
+    stats = ingest.ingest(TK_RF_TXT, collection, _FakeEmbedder(), checkpoint_dir=tmp_path / 'checkpoints')
+
+    checkpoint_text = (tmp_path / 'checkpoints' / 'tk_rf.txt').read_text(encoding='utf-8')
+    expected = _articles_from_text(checkpoint_text, tmp_path)
+    assert not stats['failed_ids']
+    assert collection.count() == len(expected) == len(_articles_from_text('\n\n'.join(pages), tmp_path))
+
+
+def test_ingest_reloads_recreated_collection(tmp_path, monkeypatch):
+    ingest = pytest.importorskip('ingest')
+    from memory_collection import InMemoryCollection
+
+    pages = _pages_split_before_headings(TK_RF_TXT.read_text(encoding='utf-8'))
+    monkeypatch.setattr(ingest, 'iter_pages', lambda *args, **kwargs: iter(pages))
+    first = InMemoryCollection('tk_rf_test')
+    ingest.ingest(TK_RF_TXT, first, _FakeEmbedder(), checkpoint_dir=tmp_path / 'checkpoints')
+
+    # Та же коллекция пересоздана пустой: контрольная точка не должна пропустить все статьи
+    recreated = InMemoryCollection('tk_rf_test')
+    ingest.ingest(TK_RF_TXT, recreated, _FakeEmbedder(), checkpoint_dir=tmp_path / 'checkpoints')
+
+    assert recreated.count() == first.count() > 400
+
+
+def test_ingest_resumes_from_text_checkpoint_and_closes_it(tmp_path, monkeypatch):
+    ingest = pytest.importorskip('ingest')
+    from memory_collection import InMemoryCollection
+
+    pages = _pages_split_before_headings(TK_RF_TXT.read_text(encoding='utf-8'))
+    monkeypatch.setattr(ingest, 'iter_pages', lambda *args, **kwargs: iter(pages))
+    first = InMemoryCollection('tk_rf_test')
+    ingest.ingest(TK_RF_TXT, first, _FakeEmbedder(), checkpoint_dir=tmp_path / 'checkpoints')
+
+    # Сбой после извлечения текста: разбиение и загрузка повторяются по тексту из контрольной точки
+    state_path = tmp_path / 'checkpoints' / 'state.json'
+    state = json.loads(state_path.read_text(encoding='utf-8'))
+    state['done'] = ['extract']
+    state_path.write_text(json.dumps(state), encoding='utf-8')
+    monkeypatch.setattr(ingest, 'iter_pages', lambda *args, **kwargs: pytest.fail('PDF читается повторно'))
+    resumed = InMemoryCollection('tk_rf_test')
+    gc.collect()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ResourceWarning)
+        ingest.ingest(TK_RF_TXT, resumed, _FakeEmbedder(), checkpoint_dir=tmp_path / 'checkpoints')
+        gc.collect()
+
+    assert resumed.count() == first.count() > 400
+    # Файл контрольной точки закрыт, а не оставлен сборщику мусора
+    assert not [warning for warning in caught
+                if issubclass(warning.category, ResourceWarning) and 'tk_rf.txt' in str(warning.message)]
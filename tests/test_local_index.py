@@ -0,0 +1,39 @@
+import numpy as np
+
+from fill_db_story import data_version, fill_db_bulk, sync_from_json
+from local_index import LocalIndexRegistry
+from memory_collection import InMemoryClient
+
+
+class _FakeEmbedder:
+    def texts_to_embeddings(self, texts, verbose=False):
+        # Эмбеддинг зависит от текста, чтобы правка статьи меняла вектор
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_registry_sees_sync_that_keeps_record_count(tmp_path):
+    client = InMemoryClient()
+    collection = client.create_collection('tk_rf')
+    articles = {'Статья 1': 'старая редакция', 'Статья 2': 'без изменений'}
+    fill_db_bulk(articles.items(), _FakeEmbedder(), collection)
+    registry = LocalIndexRegistry(client, check_interval=0)
+    index = registry.get('tk_rf')
+    assert index.data_version == data_version(collection) != 0
+
+    # Синхронизация меняет текст статьи, но не число записей
+    summary = sync_from_json({**articles, 'Статья 1': 'новая редакция статьи'}, _FakeEmbedder(), collection,
+                             manifest_path=str(tmp_path / 'manifest.json'))
+    assert summary['changed'] == ['Статья 1']
+    assert collection.count() == index.count()
+
+    index = registry.get('tk_rf')
+    assert index.data_version == data_version(collection)
+    texts = {metadata['text'] for metadata in index.metadatas}
+    assert 'новая редакция статьи' in texts and 'старая редакция' not in texts
+
+
+def test_data_version_keeps_distance_metric():
+    collection = InMemoryClient().create_collection('tk_rf', metadata={'hnsw:space': 'cosine'})
+    fill_db_bulk([('Статья 1', 'текст')], _FakeEmbedder(), collection)
+    assert collection.metadata['hnsw:space'] == 'cosine'
+    assert data_version(collection) != 0
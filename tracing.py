@@ -0,0 +1,113 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Границы корзин гистограмм (сек): от быстрых этапов (токенизация) до генерации
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('trace_id', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Tracer:
+    def __init__(self, log_path: Optional[str] = None, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Замеры этапов конвейера вопрос-ответ: длительности копятся в гистограммах по этапам
+        (экспорт в текстовом формате Prometheus) и, если задан log_path, пишутся в JSON-лог трасс
+        :param log_path: файл JSON-лога (по строке на этап), None - не писать
+        :param buckets: границы корзин гистограмм (сек)
+        """
+        self.buckets = buckets
+        self._histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._log = open(log_path, 'a', encoding='utf-8', buffering=1) if log_path else None
+
+    @contextmanager
+    def trace(self) -> Iterator[str]:
+        """Начинает трассу запроса: этапы внутри блока (в том же потоке) получают общий trace_id"""
+        token = _trace_id.set(uuid.uuid4().hex[:16])
+        try:
+            yield _trace_id.get()
+        finally:
+            _trace_id.reset(token)
+
+    def traced(self, func):
+        """Декоратор: каждый вызов функции - отдельная трасса"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.trace():
+                return func(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def span(self, stage: str, **attributes) -> Iterator[dict]:
+        """
+        Замер этапа. В возвращаемый словарь можно дописать атрибуты (например, число токенов)
+        :param stage: название этапа
+        """
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(stage, time.perf_counter() - start, **attributes)
+
+    def record(self, stage: str, duration: float, **attributes) -> None:
+        """Учитывает уже измеренную длительность этапа (сек)"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(duration)
+            if self._log is not None:
+                self._log.write(json.dumps({
+                    'trace_id': _trace_id.get(),
+                    'stage': stage,
+                    'time': time.time(),
+                    'duration': duration,
+                    **attributes
+                }, ensure_ascii=False, default=str) + '\n')
+
+    def prometheus_text(self) -> str:
+        """Гистограммы этапов в текстовом формате Prometheus"""
+        lines = ['# HELP qa_stage_duration_seconds Длительность этапов конвейера вопрос-ответ',
+                 '# TYPE qa_stage_duration_seconds histogram']
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'qa_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'qa_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'qa_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """Количество замеров и среднее время по этапам"""
+        with self._lock:
+            return {
+                stage: {'count': histogram.count, 'avg': histogram.sum / histogram.count}
+                for stage, histogram in self._histograms.items() if histogram.count
+            }
+
+
+# Единый трассировщик процесса; JSON-лог включается переменной TRACE_LOG
+tracer = Tracer(log_path=os.getenv('TRACE_LOG'))